@@ -1,7 +1,37 @@
 from django.apps import AppConfig
+from django.db.models.signals import m2m_changed, post_delete, post_save
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
     verbose_name = 'Зона АПИ'
+
+    def ready(self):
+        from core.models import (Ingredient, Recipe, RecipeIngredient,
+                                 RecipeTag, Tag, User)
+        from core.signals import bulk_loaded
+
+        from . import recipe_cache
+        from .catalogs import ingredient_catalog, tag_catalog
+        from .indexes import ingredient_index
+
+        for signal in (post_save, post_delete, bulk_loaded):
+            signal.connect(ingredient_index.invalidate, sender=Ingredient)
+            signal.connect(tag_catalog.invalidate, sender=Tag)
+            signal.connect(ingredient_catalog.invalidate, sender=Ingredient)
+            signal.connect(recipe_cache.invalidate_catalog, sender=Tag)
+            signal.connect(recipe_cache.invalidate_catalog, sender=Ingredient)
+        for signal in (post_save, post_delete):
+            signal.connect(recipe_cache.invalidate_recipe, sender=Recipe)
+            for connection_model in (RecipeIngredient, RecipeTag):
+                signal.connect(
+                    recipe_cache.invalidate_recipe_of_connection,
+                    sender=connection_model)
+        for model in (Recipe, RecipeIngredient, RecipeTag):
+            bulk_loaded.connect(recipe_cache.invalidate_catalog, sender=model)
+        for connection_model in (RecipeIngredient, RecipeTag):
+            m2m_changed.connect(
+                recipe_cache.invalidate_recipe_connections,
+                sender=connection_model)
+        post_save.connect(recipe_cache.invalidate_author, sender=User)
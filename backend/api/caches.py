@@ -0,0 +1,36 @@
+import time
+
+from django.core.cache import caches
+
+
+def get_cache(alias):
+    """Cache by alias or None if caching is turned off."""
+    if alias is None:
+        return None
+    return caches[alias]
+
+
+def get_versions(cache, keys):
+    """Current values of version keys, missing ones are initialized.
+
+    Versions start from current time, so after eviction of version key
+    values cached under previous versions aren't read.
+    """
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return versions
+
+
+def bump_version(cache, key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def touch_version(cache, key):
+    """Set version key to current time, so it works as modification time."""
+    cache.set(key, time.time_ns(), timeout=None)
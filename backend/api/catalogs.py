@@ -0,0 +1,131 @@
+import gzip
+import hashlib
+import re
+import time
+from threading import Lock
+
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+
+from .caches import get_cache, get_versions, touch_version
+from core.models import Ingredient, Tag
+
+QUALITY = re.compile(r'^q=([01](?:\.\d{0,3})?)$')
+
+
+def accepts_gzip(accept_encoding):
+    """Whether Accept-Encoding header allows gzip (q > 0 or by *)."""
+    qualities = {}
+    for item in accept_encoding.split(','):
+        coding, *params = (part.strip() for part in item.split(';'))
+        quality = 1.0
+        for param in params:
+            match = QUALITY.match(param.lower().replace(' ', ''))
+            if match:
+                quality = float(match[1])
+        qualities[coding.lower()] = quality
+    if 'gzip' in qualities:
+        return qualities['gzip'] > 0
+    return qualities.get('*', 0) > 0
+
+
+class CatalogPayload:
+    """Whole catalog rendered to JSON and gzipped once per its version.
+
+    ETag is digest of content, so it is equal in all workers for equal
+    data, gzipped body has its own ETag. Version is kept in
+    CATALOG_CACHE_ALIAS cache and is set to the time of last write, it
+    is used for Last-Modified. If the cache isn't configured, payload is
+    rebuilt by signals in the current process and by ttl in the others
+    and Last-Modified isn't sent.
+    """
+
+    def __init__(self, name, queryset, fields, ttl):
+        self.name = name
+        self.queryset = queryset
+        self.fields = fields
+        self.ttl = ttl
+        self.version_key = f'catalog-version:{name}'
+        self.lock = Lock()
+        self.state = None
+
+    def invalidate(self, *args, **kwargs):
+        transaction.on_commit(self.reset)
+
+    def reset(self):
+        cache = get_cache(settings.CATALOG_CACHE_ALIAS)
+        if cache is not None:
+            touch_version(cache, self.version_key)
+        self.state = None
+
+    def get_version(self):
+        cache = get_cache(settings.CATALOG_CACHE_ALIAS)
+        if cache is None:
+            return None
+        return get_versions(cache, (self.version_key,))[self.version_key]
+
+    def build(self, version):
+        content = JSONRenderer().render(
+            list(self.queryset.order_by('id').values(*self.fields)))
+        digest = hashlib.sha256(content).hexdigest()[:32]
+        return {
+            'version': version,
+            'built_at': time.monotonic(),
+            'etag': f'"{self.name}-{digest}"',
+            'gzip_etag': f'"{self.name}-{digest}-gzip"',
+            'last_modified': version and version // 10 ** 9,
+            'content': content,
+            'gzipped': gzip.compress(content, mtime=0),
+        }
+
+    def is_outdated(self, state, version):
+        if state is None:
+            return True
+        if version is None:
+            return time.monotonic() - state['built_at'] > self.ttl
+        return state['version'] != version
+
+    def get_state(self):
+        version = self.get_version()
+        state = self.state
+        if self.is_outdated(state, version):
+            with self.lock:
+                if self.state is state:
+                    self.state = self.build(version)
+                state = self.state
+        return state
+
+    def get_response(self, request):
+        """Response with payload or 304 if client has current version."""
+        state = self.get_state()
+        gzipped = accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        etag = state['gzip_etag'] if gzipped else state['etag']
+        response = get_conditional_response(
+            request, etag=etag, last_modified=state['last_modified'])
+        if response is None:
+            if gzipped:
+                response = HttpResponse(
+                    state['gzipped'], content_type='application/json')
+                response['Content-Encoding'] = 'gzip'
+            else:
+                response = HttpResponse(
+                    state['content'], content_type='application/json')
+        response['ETag'] = etag
+        if state['last_modified']:
+            response['Last-Modified'] = http_date(state['last_modified'])
+        patch_vary_headers(response, ('Accept-Encoding',))
+        patch_cache_control(response, no_cache=True)
+        return response
+
+
+tag_catalog = CatalogPayload(
+    'tags', Tag.objects.all(), ('id', 'name', 'slug'),
+    settings.CATALOG_PAYLOAD_TTL)
+ingredient_catalog = CatalogPayload(
+    'ingredients', Ingredient.objects.all(),
+    ('id', 'name', 'measurement_unit'), settings.CATALOG_PAYLOAD_TTL)
@@ -0,0 +1,59 @@
+import csv
+import json
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+
+class EchoBuffer:
+    """Pseudo buffer which returns written value instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    """Yield shopping cart rows as CSV lines."""
+    writer = csv.writer(EchoBuffer())
+    yield writer.writerow(settings.SHOPPING_CART_HEADERS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def text_lines(rows):
+    """Yield shopping cart rows as human readable lines."""
+    for name, measurement_unit, amount in rows:
+        yield f'{name} ({measurement_unit}) — {amount}\n'
+
+
+def json_lines(rows):
+    """Yield shopping cart rows as parts of JSON array."""
+    separator = ''
+    yield '['
+    for name, measurement_unit, amount in rows:
+        yield separator + json.dumps(
+            {'name': name,
+             'measurement_unit': measurement_unit,
+             'amount': amount},
+            ensure_ascii=False)
+        separator = ','
+    yield ']'
+
+
+EXPORTERS = {
+    'csv': csv_lines,
+    'txt': text_lines,
+    'json': json_lines,
+}
+
+
+def shopping_cart_response(rows, renderer):
+    """Streaming attachment response with rows in renderer format."""
+    response = StreamingHttpResponse(
+        (line.encode(renderer.charset or 'utf-8')
+         for line in EXPORTERS[renderer.format](rows)),
+        content_type=f'{renderer.media_type}; charset=utf-8')
+    response['Content-Disposition'] = (
+        'attachment; '
+        f'filename="{settings.SHOPPING_CART_FILENAME}.{renderer.format}"')
+    return response
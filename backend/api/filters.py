@@ -4,14 +4,18 @@ from django.db.models.aggregates import Case, When
 from django_filters import rest_framework as filters
 from rest_framework.filters import SearchFilter
 
+from .relations import get_user_relations
 from core.models import Recipe, Tag
 
 
 class RecipeFilter(filters.FilterSet):
     """Filter to Recipe viewset."""
 
-    is_favorited = filters.BooleanFilter(label='is_favorited')
-    is_in_shopping_cart = filters.BooleanFilter(label='is_in_shopping_cart')
+    is_favorited = filters.BooleanFilter(
+        label='is_favorited', method='relation_filter')
+    is_in_shopping_cart = filters.BooleanFilter(
+        label='is_in_shopping_cart', method='relation_filter')
+    search = filters.CharFilter(label='search', method='search_filter')
     tags = filters.ModelMultipleChoiceFilter(
         field_name='tags__slug',
         to_field_name='slug',
@@ -21,6 +25,22 @@ class RecipeFilter(filters.FilterSet):
         model = Recipe
         fields = ('author',)
 
+    relation_ids_attributes = {
+        'is_favorited': 'favorite_ids',
+        'is_in_shopping_cart': 'shopping_cart_ids',
+    }
+
+    def relation_filter(self, recipes, name, value):
+        recipe_ids = getattr(
+            get_user_relations(self.request),
+            self.relation_ids_attributes[name])
+        if value:
+            return recipes.filter(id__in=recipe_ids)
+        return recipes.exclude(id__in=recipe_ids)
+
+    def search_filter(self, recipes, name, text):
+        return recipes.search(text)
+
 
 class OrderingSearchFilter(SearchFilter):
     """Search filter for ordering by seach fields."""
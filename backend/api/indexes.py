@@ -0,0 +1,111 @@
+from bisect import bisect_left
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+
+from core.models import Ingredient
+
+TRIGRAM_LENGTH = 3
+
+
+class IngredientNameIndex:
+    """In-memory case-folded prefix and substring index of ingredients.
+
+    Ranking repeats OrderingSearchFilter: ingredients starting with the
+    whole search phrase go first, then starting with the first term,
+    then the others.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.lock = Lock()
+        self.state = None
+
+    def invalidate(self, *args, **kwargs):
+        self.state = None
+
+    def build(self):
+        ingredients = [
+            (name.casefold(), {'id': id,
+                               'name': name,
+                               'measurement_unit': measurement_unit})
+            for id, name, measurement_unit
+            in Ingredient.objects.order_by('id').values_list(
+                'id', 'name', 'measurement_unit')]
+        by_name = sorted(range(len(ingredients)),
+                         key=lambda position: ingredients[position][0])
+        trigrams = {}
+        for position, (folded_name, _) in enumerate(ingredients):
+            for start in range(len(folded_name) - TRIGRAM_LENGTH + 1):
+                trigrams.setdefault(
+                    folded_name[start:start + TRIGRAM_LENGTH],
+                    set()).add(position)
+        return {
+            'built_at': monotonic(),
+            'ingredients': ingredients,
+            'sorted_names': [ingredients[position][0]
+                             for position in by_name],
+            'by_name': by_name,
+            'trigrams': trigrams,
+        }
+
+    def get_state(self):
+        state = self.state
+        if state is None or monotonic() - state['built_at'] > self.ttl:
+            with self.lock:
+                if self.state is state:
+                    self.state = self.build()
+                state = self.state
+        return state
+
+    def all(self):
+        return [data for _, data in self.get_state()['ingredients']]
+
+    def prefix_positions(self, state, prefix):
+        sorted_names = state['sorted_names']
+        start = bisect_left(sorted_names, prefix)
+        end = start
+        while (end < len(sorted_names)
+               and sorted_names[end].startswith(prefix)):
+            end += 1
+        return set(state['by_name'][start:end])
+
+    def substring_positions(self, state, term):
+        if len(term) < TRIGRAM_LENGTH:
+            return {position
+                    for position, (folded_name, _)
+                    in enumerate(state['ingredients'])
+                    if term in folded_name}
+        candidates = None
+        for start in range(len(term) - TRIGRAM_LENGTH + 1):
+            positions = state['trigrams'].get(
+                term[start:start + TRIGRAM_LENGTH], set())
+            candidates = (positions if candidates is None
+                          else candidates & positions)
+            if not candidates:
+                return set()
+        return {position for position in candidates
+                if term in state['ingredients'][position][0]}
+
+    def search(self, terms, limit=None):
+        """Ingredients which names contain all terms ordered by rank."""
+        state = self.get_state()
+        terms = [term.casefold() for term in terms]
+        positions = self.substring_positions(state, terms[0])
+        for term in terms[1:]:
+            positions &= self.substring_positions(state, term)
+        phrase_matches = self.prefix_positions(state, ' '.join(terms))
+        first_term_matches = self.prefix_positions(state, terms[0])
+        ranked = sorted(
+            positions,
+            key=lambda position: (
+                0 if position in phrase_matches
+                else 1 if position in first_term_matches
+                else 2,
+                position))
+        return [state['ingredients'][position][1]
+                for position in ranked[:limit]]
+
+
+ingredient_index = IngredientNameIndex(settings.INGREDIENT_INDEX_TTL)
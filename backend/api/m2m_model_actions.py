@@ -1,26 +1,141 @@
 from django.conf import settings
-from django.db.models import ObjectDoesNotExist
-from django.db.models.deletion import IntegrityError
+from django.db import connection, transaction
 from rest_framework import status
 from rest_framework.response import Response
 
 from .exceptions import ErrorException
+from .relations import invalidate_user_relations
+from core.counters import shift_counter
+
+ADDED = 'added'
+ALREADY_ADDED = 'already_added'
+REMOVED = 'removed'
+NOT_ADDED = 'not_added'
+NOT_FOUND = 'not_found'
+
+
+def shift_counters(model, step, **kwargs):
+    """Change denormalized counters of objects linked by m2m model."""
+    for field_name, counter_name in model.COUNTERS.items():
+        linked_object = kwargs[field_name]
+        shift_counter(type(linked_object).objects.filter(pk=linked_object.pk),
+                      counter_name, step)
+
+
+def on_connections_change(model, step, **kwargs):
+    """Update everything that depends on m2m model connections."""
+    shift_counters(model, step, **kwargs)
+    user_id = kwargs[model.USER_FIELD].id
+    transaction.on_commit(lambda: invalidate_user_relations(user_id))
+
+
+def get_column_values(model, kwargs):
+    """Quoted columns of m2m model with pks of linked objects."""
+    quote_name = connection.ops.quote_name
+    return {quote_name(model._meta.get_field(field_name).column):
+            linked_object.pk
+            for field_name, linked_object in kwargs.items()}
 
 
 def create_connection(model, **kwargs):
-    """Create link in m2m model."""
-    try:
-        model.objects.create(**kwargs)
-    except IntegrityError as error:
-        raise ErrorException(settings.
-                             ERROR_M2M_CONNECTION_MSGS[error.args[0]])
+    """Create link in m2m model with one INSERT ... ON CONFLICT DO NOTHING."""
+    column_values = get_column_values(model, kwargs)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO {} ({}) VALUES ({}) ON CONFLICT DO NOTHING '
+                'RETURNING 1'.format(
+                    connection.ops.quote_name(model._meta.db_table),
+                    ', '.join(column_values),
+                    ', '.join(('%s',) * len(column_values))),
+                tuple(column_values.values()))
+            if cursor.fetchone() is None:
+                raise ErrorException(
+                    settings.ALREADY_CONNECTED_MSGS[model.__name__])
+        on_connections_change(model, 1, **kwargs)
 
 
 def delete_connection_n_response(model, **kwargs):
     """Delete link in m2m model. If complete return response object."""
-    try:
-        model.objects.get(**kwargs).delete()
-    except ObjectDoesNotExist:
-        raise ErrorException(settings.NOT_CONNECTED_MSG)
-    else:
-        return Response(status=status.HTTP_204_NO_CONTENT)
+    column_values = get_column_values(model, kwargs)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM {} WHERE {} RETURNING 1'.format(
+                    connection.ops.quote_name(model._meta.db_table),
+                    ' AND '.join(f'{column} = %s'
+                                 for column in column_values)),
+                tuple(column_values.values()))
+            if cursor.fetchone() is None:
+                raise ErrorException(settings.NOT_CONNECTED_MSG)
+        on_connections_change(model, -1, **kwargs)
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+def get_linked_field(model):
+    """Field of m2m model which links user with counted object."""
+    field_name, = model.COUNTERS
+    return model._meta.get_field(field_name)
+
+
+def on_many_connections_change(model, step, user_id, linked_ids):
+    """Update everything that depends on batch of m2m model connections."""
+    field = get_linked_field(model)
+    counter_name = model.COUNTERS[field.name]
+    shift_counter(field.related_model.objects.filter(pk__in=linked_ids),
+                  counter_name, step)
+    transaction.on_commit(lambda: invalidate_user_relations(user_id))
+
+
+def get_sql_names(model):
+    """Quoted table, linked object and user columns of m2m model."""
+    quote_name = connection.ops.quote_name
+    return (quote_name(model._meta.db_table),
+            quote_name(get_linked_field(model).column),
+            quote_name(model._meta.get_field(model.USER_FIELD).column))
+
+
+def change_connections(model, user_id, ids, sql, step, statuses):
+    """Run sql returning changed ids for existing objects of ids.
+
+    Returns outcomes per id (statuses of changed and unchanged links) and
+    changed ids.
+    """
+    ids = list(dict.fromkeys(ids))
+    existing_ids = set(get_linked_field(model).related_model.objects.filter(
+        pk__in=ids).values_list('pk', flat=True))
+    changed_ids = set()
+    if existing_ids:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, (user_id, sorted(existing_ids)))
+            changed_ids = {linked_id for linked_id, in cursor.fetchall()}
+    if changed_ids:
+        on_many_connections_change(model, step, user_id, changed_ids)
+    changed, unchanged = statuses
+    return ([{'id': linked_id,
+              'status': (changed if linked_id in changed_ids
+                         else unchanged if linked_id in existing_ids
+                         else NOT_FOUND)}
+             for linked_id in ids],
+            changed_ids)
+
+
+def create_connections(model, user_id, ids):
+    """Link user with objects by ids with one INSERT ... ON CONFLICT."""
+    table, linked_column, user_column = get_sql_names(model)
+    return change_connections(
+        model, user_id, ids,
+        f'INSERT INTO {table} ({user_column}, {linked_column}) '
+        'SELECT %s, linked_id FROM UNNEST(%s) AS linked_id '
+        f'ON CONFLICT DO NOTHING RETURNING {linked_column}',
+        1, (ADDED, ALREADY_ADDED))
+
+
+def delete_connections(model, user_id, ids):
+    """Unlink user from objects by ids with one DELETE ... RETURNING."""
+    table, linked_column, user_column = get_sql_names(model)
+    return change_connections(
+        model, user_id, ids,
+        f'DELETE FROM {table} WHERE {user_column} = %s '
+        f'AND {linked_column} = ANY(%s) RETURNING {linked_column}',
+        -1, (REMOVED, NOT_ADDED))
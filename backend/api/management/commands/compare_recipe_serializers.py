@@ -0,0 +1,85 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+
+from ...relations import UserRelations
+from ...row_serializers import get_recipe_rows, serialize_recipes
+from ...serializers import RecipeReadSerializer
+from core.models import Recipe, RecipeIngredient, Tag
+
+
+class Command(BaseCommand):
+    help = ('Measure values based recipe serialization against '
+            'RecipeReadSerializer on recipes of current database and '
+            'check that they are equal there (parity of edge cases is '
+            'checked by api.tests)')
+
+    def serialize_with_drf(self, recipes, relations):
+        return RecipeReadSerializer(relations.mark_recipes(list(
+            recipes.select_related('author').prefetch_related(
+                Prefetch('tags', queryset=Tag.objects.order_by('id')),
+                Prefetch(
+                    'ingredient_many_table',
+                    queryset=RecipeIngredient.objects.select_related(
+                        'ingredient').order_by('id'))))), many=True).data
+
+    def serialize_with_rows(self, recipes, relations):
+        return serialize_recipes(get_recipe_rows(recipes), relations)
+
+    def measure(self, serialize, recipes, relations, repeat):
+        timings = []
+        for _ in range(repeat):
+            started_at = time.perf_counter()
+            serialize(recipes, relations)
+            timings.append(time.perf_counter() - started_at)
+        return min(timings)
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.all()[:options['limit']]
+        relations = (UserRelations.load(options['user'])
+                     if options['user'] else UserRelations())
+        if not recipes.exists():
+            raise CommandError('There are no recipes to compare')
+        expected = self.serialize_with_drf(recipes, relations)
+        actual = self.serialize_with_rows(recipes, relations)
+        mismatched_ids = [
+            expected_data['id']
+            for expected_data, actual_data in zip(expected, actual)
+            if expected_data != actual_data]
+        if len(expected) != len(actual) or mismatched_ids:
+            raise CommandError(
+                f'Representations differ: {len(expected)} recipes by '
+                f'serializer, {len(actual)} by rows, '
+                f'mismatched ids {mismatched_ids}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Representations of {len(expected)} recipes are equal'))
+        if not options['repeat']:
+            return
+        drf_time = self.measure(
+            self.serialize_with_drf, recipes, relations, options['repeat'])
+        rows_time = self.measure(
+            self.serialize_with_rows, recipes, relations, options['repeat'])
+        self.stdout.write(
+            f'RecipeReadSerializer: {drf_time * 1000:.2f} ms\n'
+            f'serialize_recipes: {rows_time * 1000:.2f} ms\n'
+            f'speedup: {drf_time / rows_time:.1f}x')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-l',
+            '--limit',
+            type=int,
+            default=100,
+            help='Number of newest recipes to compare')
+        parser.add_argument(
+            '-u',
+            '--user',
+            type=int,
+            help='Id of user whose relations are marked')
+        parser.add_argument(
+            '-r',
+            '--repeat',
+            type=int,
+            default=20,
+            help='Number of timed runs, the best one is shown, 0 to skip')
@@ -1,5 +1,15 @@
+import json
+from collections import OrderedDict
+from datetime import datetime
+
 from django.conf import settings
-from rest_framework.pagination import PageNumberPagination
+from django.db import connections
+from django.db.models import Q
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class PagePaginationWithLimit(PageNumberPagination):
@@ -8,3 +18,132 @@ class PagePaginationWithLimit(PageNumberPagination):
     page_size = settings.DEFAULT_PAGE_SIZE
     page_size_query_param = 'limit'
     max_page_size = 100
+
+
+class RecipeCursorPagination(BasePagination):
+    """Keyset pagination by (pub_date, id) from newest to oldest.
+
+    Page is requested with opaque cursor, so database doesn't have to
+    skip previous rows or count all of them. Count is returned only if
+    requested with count=estimate and is taken from the query plan.
+    Cursor ordering replaces any other ordering (e.g. search rank).
+    """
+
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    page_size = settings.DEFAULT_PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def encode_cursor(self, reverse, position):
+        pub_date, id = position
+        return urlsafe_base64_encode(json.dumps(
+            (reverse, pub_date.isoformat(), id)).encode())
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return False, None
+        try:
+            reverse, pub_date, id = json.loads(urlsafe_base64_decode(cursor))
+            return bool(reverse), (datetime.fromisoformat(pub_date), int(id))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def estimate_count(self, queryset):
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        return plan[0]['Plan']['Plan Rows']
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.reverse, self.position = self.decode_cursor(request)
+        self.count = (
+            self.estimate_count(queryset)
+            if request.query_params.get(self.count_query_param) == 'estimate'
+            else None)
+        page_size = self.get_page_size(request)
+        if self.position:
+            pub_date, id = self.position
+            if self.reverse:
+                queryset = queryset.filter(
+                    Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, id__gt=id))
+            else:
+                queryset = queryset.filter(
+                    Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=id))
+        queryset = queryset.order_by(
+            *(('pub_date', 'id') if self.reverse else ('-pub_date', '-id')))
+        self.page = list(queryset[:page_size + 1])
+        has_more = len(self.page) > page_size
+        del self.page[page_size:]
+        if self.reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = bool(self.position), has_more
+        else:
+            self.has_next, self.has_previous = has_more, bool(self.position)
+        return self.page
+
+    def get_position(self, recipe):
+        if isinstance(recipe, dict):
+            return recipe['pub_date'], recipe['id']
+        return recipe.pub_date, recipe.id
+
+    def get_link(self, reverse, recipe):
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(
+                reverse,
+                self.get_position(recipe) if recipe else self.position))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.get_link(False, self.page[-1] if self.page else None)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.get_link(True, self.page[0] if self.page else None)
+
+    def get_paginated_response(self, data):
+        response_data = OrderedDict()
+        if self.count is not None:
+            response_data['count'] = self.count
+        response_data['next'] = self.get_next_link()
+        response_data['previous'] = self.get_previous_link()
+        response_data['results'] = data
+        return Response(response_data)
+
+
+class PageOrCursorPagination(PagePaginationWithLimit):
+    """Page pagination which switches to cursor one if cursor is sent."""
+
+    cursor_pagination_class = RecipeCursorPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (self.cursor_pagination_class.cursor_query_param
+                in request.query_params
+                and self.page_query_param not in request.query_params):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view)
+        self.cursor_paginator = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,145 @@
+from django.conf import settings
+from django.db import transaction
+
+from .caches import bump_version, get_cache, get_versions
+from .relations import UserRelations, get_user_relations
+from .row_serializers import get_recipe_rows, serialize_recipes
+from .serializers import UserReadSerializer
+from core.models import Recipe
+
+CATALOG_VERSION_KEY = 'recipe-catalog-version'
+
+
+def get_recipe_version_key(recipe_id):
+    return f'recipe-version:{recipe_id}'
+
+
+def get_author_version_key(author_id):
+    return f'recipe-author-version:{author_id}'
+
+
+def get_recipe_cache():
+    return get_cache(settings.RECIPE_CACHE_ALIAS)
+
+
+def get_body_keys(cache, rows):
+    """Body cache keys of recipes rows with id and author_id."""
+    versions = get_versions(cache, (
+        CATALOG_VERSION_KEY,
+        *(get_recipe_version_key(row['id']) for row in rows),
+        *(get_author_version_key(row['author_id']) for row in rows)))
+    return {
+        row['id']: 'recipe-body:{}:{}:{}:{}'.format(
+            versions[CATALOG_VERSION_KEY],
+            row['id'],
+            versions[get_recipe_version_key(row['id'])],
+            versions[get_author_version_key(row['author_id'])])
+        for row in rows}
+
+
+def serialize_public_bodies(recipe_ids):
+    """Viewer independent recipe representations with relative urls."""
+    return {data['id']: data
+            for data in serialize_recipes(
+                get_recipe_rows(Recipe.objects.filter(id__in=recipe_ids)),
+                UserRelations())}
+
+
+def get_public_bodies(cache, rows):
+    body_keys = get_body_keys(cache, rows)
+    cached_bodies = cache.get_many(body_keys.values())
+    bodies = {recipe_id: cached_bodies[key]
+              for recipe_id, key in body_keys.items()
+              if key in cached_bodies}
+    missing_ids = body_keys.keys() - bodies.keys()
+    if missing_ids:
+        new_bodies = serialize_public_bodies(missing_ids)
+        cache.set_many(
+            {body_keys[recipe_id]: body
+             for recipe_id, body in new_bodies.items()},
+            settings.RECIPE_CACHE_TIMEOUT)
+        bodies.update(new_bodies)
+    return [bodies[row['id']] for row in rows if row['id'] in bodies]
+
+
+def build_absolute_url(request, url):
+    if url is None:
+        return url
+    return request.build_absolute_uri(url)
+
+
+def build_absolute_variant_urls(request, variants):
+    if variants is None:
+        return variants
+    return {variant_name: {format: build_absolute_url(request, url)
+                           for format, url in urls.items()}
+            for variant_name, urls in variants.items()}
+
+
+def overlay(request, body):
+    """Add viewer dependent fields to public recipe body."""
+    relations = get_user_relations(request)
+    return {
+        **body,
+        'author': {
+            **body['author'],
+            'is_subscribed': (
+                body['author']['id'] in relations.subscription_ids),
+            'avatar': build_absolute_url(request, body['author']['avatar']),
+            'avatar_variants': build_absolute_variant_urls(
+                request, body['author']['avatar_variants']),
+        },
+        'is_favorited': body['id'] in relations.favorite_ids,
+        'is_in_shopping_cart': body['id'] in relations.shopping_cart_ids,
+        'image': build_absolute_url(request, body['image']),
+        'image_variants': build_absolute_variant_urls(
+            request, body['image_variants']),
+    }
+
+
+def get_recipes_data(request, rows):
+    """Representations of recipes assembled from cached bodies.
+
+    rows need to have id and author_id only, bodies missing in cache
+    are serialized from database.
+    """
+    return [overlay(request, body)
+            for body in get_public_bodies(get_recipe_cache(), rows)]
+
+
+def invalidate(version_key):
+    cache = get_recipe_cache()
+    if cache is not None:
+        transaction.on_commit(lambda: bump_version(cache, version_key))
+
+
+def invalidate_recipe(sender, instance, **kwargs):
+    invalidate(get_recipe_version_key(instance.id))
+
+
+def invalidate_recipe_of_connection(sender, instance, **kwargs):
+    invalidate(get_recipe_version_key(instance.recipe_id))
+
+
+def invalidate_recipe_connections(sender, instance, action, reverse, pk_set,
+                                  **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate(get_recipe_version_key(instance.id))
+    elif pk_set is None:
+        invalidate(CATALOG_VERSION_KEY)
+    else:
+        for recipe_id in pk_set:
+            invalidate(get_recipe_version_key(recipe_id))
+
+
+def invalidate_author(sender, instance, update_fields=None, **kwargs):
+    if (update_fields is not None
+            and not set(update_fields) & set(UserReadSerializer.Meta.fields)):
+        return
+    invalidate(get_author_version_key(instance.id))
+
+
+def invalidate_catalog(sender, **kwargs):
+    invalidate(CATALOG_VERSION_KEY)
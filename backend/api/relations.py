@@ -0,0 +1,107 @@
+from django.conf import settings
+from django.db.models import IntegerField, Value
+
+from .caches import bump_version, get_cache, get_versions
+from core import models
+
+FAVORITE, SHOPPING_CART, SUBSCRIPTION = range(3)
+
+
+class UserRelations:
+    """Ids of recipes and authors which user is linked with."""
+
+    def __init__(self, favorite_ids=(), shopping_cart_ids=(),
+                 subscription_ids=()):
+        self.favorite_ids = frozenset(favorite_ids)
+        self.shopping_cart_ids = frozenset(shopping_cart_ids)
+        self.subscription_ids = frozenset(subscription_ids)
+
+    @classmethod
+    def load(cls, user_id):
+        """Load all relations of user with one query."""
+        ids = {FAVORITE: [], SHOPPING_CART: [], SUBSCRIPTION: []}
+        for kind, linked_id in models.UserRecipeFavorite.objects.filter(
+                user_id=user_id).annotate(
+                kind=Value(FAVORITE, IntegerField())).values_list(
+                'kind', 'recipe_id').union(
+                models.UserRecipeShoppingList.objects.filter(
+                    user_id=user_id).annotate(
+                    kind=Value(SHOPPING_CART, IntegerField())).values_list(
+                    'kind', 'recipe_id'),
+                models.Subscription.objects.filter(
+                    subscriber_id=user_id).annotate(
+                    kind=Value(SUBSCRIPTION, IntegerField())).values_list(
+                    'kind', 'subscription_id'),
+                all=True):
+            ids[kind].append(linked_id)
+        return cls(ids[FAVORITE], ids[SHOPPING_CART], ids[SUBSCRIPTION])
+
+    def mark_users(self, users):
+        for user in users:
+            user.is_subscribed = user.id in self.subscription_ids
+        return users
+
+    def mark_recipes(self, recipes):
+        for recipe in recipes:
+            recipe.is_favorited = recipe.id in self.favorite_ids
+            recipe.is_in_shopping_cart = recipe.id in self.shopping_cart_ids
+        self.mark_users([recipe.author for recipe in recipes])
+        return recipes
+
+
+def get_version_key(user_id):
+    return f'user-relations-version:{user_id}'
+
+
+def load_user_relations(user_id):
+    cache = get_cache(settings.USER_RELATIONS_CACHE_ALIAS)
+    if cache is None:
+        return UserRelations.load(user_id)
+    version_key = get_version_key(user_id)
+    version = get_versions(cache, (version_key,))[version_key]
+    key = f'user-relations:{user_id}:{version}'
+    relations = cache.get(key)
+    if relations is None:
+        relations = UserRelations.load(user_id)
+        cache.set(key, relations, settings.USER_RELATIONS_CACHE_TIMEOUT)
+    return relations
+
+
+def get_user_relations(request):
+    """Relations of request user, loaded once per request."""
+    if not hasattr(request, 'user_relations'):
+        request.user_relations = (
+            load_user_relations(request.user.id)
+            if request.user.is_authenticated
+            else UserRelations())
+    return request.user_relations
+
+
+def invalidate_user_relations(user_id):
+    cache = get_cache(settings.USER_RELATIONS_CACHE_ALIAS)
+    if cache is not None:
+        bump_version(cache, get_version_key(user_id))
+
+
+class RelationsMixin:
+    """Mixin for set is_.* attributes of viewset objects from relations.
+
+    mark_relations_method is name of UserRelations method which marks
+    objects of viewset.
+    """
+
+    mark_relations_method = None
+
+    def mark_relations(self, objects):
+        return getattr(
+            get_user_relations(self.request),
+            self.mark_relations_method)(objects)
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is None:
+            return page
+        return self.mark_relations(page)
+
+    def get_object(self):
+        return self.mark_relations((super().get_object(),))[0]
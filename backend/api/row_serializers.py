@@ -0,0 +1,212 @@
+import json
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import TextField
+from django.db.models.expressions import RawSQL
+
+from core.images import SOURCE_KEY
+from core.models import (Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag,
+                         User)
+
+AUTHOR_FIELDS = ('email', 'id', 'username', 'first_name', 'last_name',
+                 'avatar', 'avatar_variants')
+RECIPE_FIELDS = ('id', 'name', 'image', 'image_variants', 'text',
+                 'cooking_time', 'pub_date')
+
+
+def get_sql_names(model, alias, *fields):
+    """Qualified quoted columns of model fields by their names."""
+    quote_name = connection.ops.quote_name
+    return {field: '{}.{}'.format(
+        alias, quote_name(model._meta.get_field(field).column))
+        for field in fields}
+
+
+def get_json_object_sql(columns):
+    return 'json_build_object({})'.format(', '.join(
+        f"'{key}', {column}" for key, column in columns.items()))
+
+
+def get_representation_sql():
+    """SQL of RecipeReadSerializer shaped JSON without viewer fields.
+
+    Viewer dependent fields are false placeholders and files are stored
+    names, serialize_recipes sets them in place. Tags, ingredients and
+    author are built with correlated subqueries, so the whole page is
+    read with one statement.
+    """
+    quote_name = connection.ops.quote_name
+    recipe = get_sql_names(
+        Recipe, quote_name(Recipe._meta.db_table),
+        'id', 'author', 'name', 'image', 'image_variants', 'text',
+        'cooking_time')
+    tag = get_sql_names(Tag, 't', 'id', 'name', 'slug')
+    recipe_tag = get_sql_names(RecipeTag, 'rt', 'recipe', 'tag')
+    author = get_sql_names(User, 'u', *AUTHOR_FIELDS)
+    ingredient = get_sql_names(
+        Ingredient, 'i', 'id', 'name', 'measurement_unit')
+    recipe_ingredient = get_sql_names(
+        RecipeIngredient, 'ri', 'id', 'recipe', 'ingredient', 'amount')
+    tags_sql = (
+        'COALESCE((SELECT json_agg({} ORDER BY {}) FROM {} t '
+        "JOIN {} rt ON {} = {} WHERE {} = {}), '[]')".format(
+            get_json_object_sql(tag), tag['id'],
+            quote_name(Tag._meta.db_table),
+            quote_name(RecipeTag._meta.db_table),
+            recipe_tag['tag'], tag['id'],
+            recipe_tag['recipe'], recipe['id']))
+    author_sql = '(SELECT {} FROM {} u WHERE {} = {})'.format(
+        get_json_object_sql({
+            **{field: author[field] for field in AUTHOR_FIELDS[:-2]},
+            'is_subscribed': 'false',
+            'avatar': author['avatar'],
+            'avatar_variants': author['avatar_variants']}),
+        quote_name(User._meta.db_table), author['id'], recipe['author'])
+    ingredients_sql = (
+        'COALESCE((SELECT json_agg({} ORDER BY {}) FROM {} ri '
+        "JOIN {} i ON {} = {} WHERE {} = {}), '[]')".format(
+            get_json_object_sql({
+                **ingredient, 'amount': recipe_ingredient['amount']}),
+            recipe_ingredient['id'],
+            quote_name(RecipeIngredient._meta.db_table),
+            quote_name(Ingredient._meta.db_table),
+            ingredient['id'], recipe_ingredient['ingredient'],
+            recipe_ingredient['recipe'], recipe['id']))
+    return get_json_object_sql({
+        'id': recipe['id'],
+        'tags': tags_sql,
+        'author': author_sql,
+        'ingredients': ingredients_sql,
+        'is_favorited': 'false',
+        'is_in_shopping_cart': 'false',
+        'name': recipe['name'],
+        'image': recipe['image'],
+        'image_variants': recipe['image_variants'],
+        'text': recipe['text'],
+        'cooking_time': recipe['cooking_time'],
+    }) + '::text'
+
+
+def get_recipe_rows(queryset):
+    """Values rows of recipes for serialize_recipes.
+
+    With RECIPE_FEED_JSON_AGG rows carry representation built by
+    Postgres, otherwise recipe and author columns.
+    """
+    if settings.RECIPE_FEED_JSON_AGG:
+        return queryset.values(
+            'id', 'pub_date', 'author_id',
+            representation=RawSQL(
+                get_representation_sql(), (), output_field=TextField()))
+    return queryset.values(
+        *RECIPE_FIELDS, *(f'author__{field}' for field in AUTHOR_FIELDS))
+
+
+def get_file_url(file_field, name, request):
+    """Url of stored file same as serializers.ImageField returns."""
+    if not name:
+        return None
+    url = file_field.storage.url(name)
+    if request is None:
+        return url
+    return request.build_absolute_uri(url)
+
+
+def get_variant_urls(file_field, variants, name, request):
+    """Urls of image variants or None until they are made for the file."""
+    if not name or variants.get(SOURCE_KEY) != name:
+        return None
+    return {variant_name: {format: get_file_url(
+        file_field, variant_file_name, request)
+        for format, variant_file_name in file_names.items()}
+        for variant_name, file_names in variants.items()
+        if variant_name != SOURCE_KEY}
+
+
+def group_by_recipe(rows):
+    grouped = {}
+    for recipe_id, *data in rows:
+        grouped.setdefault(recipe_id, []).append(data)
+    return grouped
+
+
+def serialize_representation_rows(rows, relations, request):
+    image_field = Recipe._meta.get_field('image')
+    avatar_field = User._meta.get_field('avatar')
+    representations = []
+    for row in rows:
+        data = json.loads(row['representation'])
+        author = data['author']
+        author['is_subscribed'] = author['id'] in relations.subscription_ids
+        author['avatar_variants'] = get_variant_urls(
+            avatar_field, author['avatar_variants'], author['avatar'],
+            request)
+        author['avatar'] = get_file_url(
+            avatar_field, author['avatar'], request)
+        data['is_favorited'] = data['id'] in relations.favorite_ids
+        data['is_in_shopping_cart'] = (
+            data['id'] in relations.shopping_cart_ids)
+        data['image_variants'] = get_variant_urls(
+            image_field, data['image_variants'], data['image'], request)
+        data['image'] = get_file_url(image_field, data['image'], request)
+        representations.append(data)
+    return representations
+
+
+def serialize_recipes(rows, relations, request=None):
+    """RecipeReadSerializer representations of get_recipe_rows rows.
+
+    Tags and ingredients of all recipes are loaded by one query each and
+    grouped by recipe, no serializer or model is instantiated per row.
+    Rows with representation built by Postgres only get viewer fields
+    and file urls.
+    """
+    rows = list(rows)
+    if not rows:
+        return []
+    if 'representation' in rows[0]:
+        return serialize_representation_rows(rows, relations, request)
+    recipe_ids = [row['id'] for row in rows]
+    tags = group_by_recipe(RecipeTag.objects.filter(
+        recipe_id__in=recipe_ids).order_by('tag_id').values_list(
+        'recipe_id', 'tag_id', 'tag__name', 'tag__slug'))
+    ingredients = group_by_recipe(RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids).order_by('id').values_list(
+        'recipe_id', 'ingredient_id', 'ingredient__name',
+        'ingredient__measurement_unit', 'amount'))
+    image_field = Recipe._meta.get_field('image')
+    avatar_field = User._meta.get_field('avatar')
+    return [{
+        'id': row['id'],
+        'tags': [{'id': id, 'name': name, 'slug': slug}
+                 for id, name, slug in tags.get(row['id'], ())],
+        'author': {
+            'email': row['author__email'],
+            'id': row['author__id'],
+            'username': row['author__username'],
+            'first_name': row['author__first_name'],
+            'last_name': row['author__last_name'],
+            'is_subscribed': (
+                row['author__id'] in relations.subscription_ids),
+            'avatar': get_file_url(
+                avatar_field, row['author__avatar'], request),
+            'avatar_variants': get_variant_urls(
+                avatar_field, row['author__avatar_variants'],
+                row['author__avatar'], request),
+        },
+        'ingredients': [{'id': id,
+                         'name': name,
+                         'measurement_unit': measurement_unit,
+                         'amount': amount}
+                        for id, name, measurement_unit, amount
+                        in ingredients.get(row['id'], ())],
+        'is_favorited': row['id'] in relations.favorite_ids,
+        'is_in_shopping_cart': row['id'] in relations.shopping_cart_ids,
+        'name': row['name'],
+        'image': get_file_url(image_field, row['image'], request),
+        'image_variants': get_variant_urls(
+            image_field, row['image_variants'], row['image'], request),
+        'text': row['text'],
+        'cooking_time': row['cooking_time'],
+    } for row in rows]
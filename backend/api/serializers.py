@@ -3,28 +3,50 @@ import base64
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.base import ContentFile
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer
 from rest_framework import serializers
 
-from core.models import Ingredient, Recipe, RecipeIngredient, Tag
+from .row_serializers import get_variant_urls
+from core.models import (Ingredient, Job, Recipe, RecipeIngredient, RecipeTag,
+                         Tag, UserShoppingListIngredient)
 
 User = get_user_model()
 
 
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Urls of processed variants of model image field."""
+
+    def __init__(self, image_field_name, **kwargs):
+        self.image_field_name = image_field_name
+        super().__init__(source='*', **kwargs)
+
+    def to_representation(self, instance):
+        variants_field_name, _ = instance.IMAGE_VARIANTS[
+            self.image_field_name]
+        return get_variant_urls(
+            instance._meta.get_field(self.image_field_name),
+            getattr(instance, variants_field_name),
+            getattr(instance, self.image_field_name).name,
+            self.context.get('request'))
+
+
 class UserReadSerializer(serializers.ModelSerializer):
     """User serializer for reading."""
 
-    # Реализован вариант который требует принудительной аннотации is_.* полей,
-    # а не через SerializerMethodField поскольку последний будет в неявном
-    # виде обращаться к БД (self.context['request'].user in
-    # recipe.<related_name>.user), что будет приводить к большому числу
-    # запросов и не будет вызывать ошибку если забыть сделать prefetch_related
+    # Реализован вариант который требует принудительной установки is_.* полей
+    # (api.relations.UserRelations), а не через SerializerMethodField
+    # поскольку последний будет в неявном виде обращаться к БД
+    # (self.context['request'].user in recipe.<related_name>.user), что будет
+    # приводить к большому числу запросов и не будет вызывать ошибку если
+    # забыть их установить
     is_subscribed = serializers.BooleanField()
+    avatar_variants = ImageVariantsField('avatar')
 
     class Meta:
         model = User
         fields = ('email', 'id', 'username', 'first_name',
-                  'last_name', 'is_subscribed', 'avatar')
+                  'last_name', 'is_subscribed', 'avatar', 'avatar_variants')
 
 
 class UserWriteSerializer(UserCreateSerializer):
@@ -127,13 +149,15 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     tags = TagSerializer(many=True)
     ingredients = IngredientReadConnectorSerializer(
         many=True, source='ingredient_many_table')
-    # Реализован вариант который требует принудительной аннотации is_.* полей,
-    # а не через SerializerMethodField поскольку последний будет в неявном
-    # виде обращаться к БД (self.context['request'].user in
-    # recipe.<related_name>.user), что будет приводить к большому числу
-    # запросов и не будет вызывать ошибку если забыть сделать prefetch_related
+    # Реализован вариант который требует принудительной установки is_.* полей
+    # (api.relations.UserRelations), а не через SerializerMethodField
+    # поскольку последний будет в неявном виде обращаться к БД
+    # (self.context['request'].user in recipe.<related_name>.user), что будет
+    # приводить к большому числу запросов и не будет вызывать ошибку если
+    # забыть их установить
     is_favorited = serializers.BooleanField()
     is_in_shopping_cart = serializers.BooleanField()
+    image_variants = ImageVariantsField('image')
 
     class Meta:
         model = Recipe
@@ -146,6 +170,7 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time')
 
@@ -212,6 +237,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             ingredient_types.add(ingredient)
         return ingredients
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
@@ -219,6 +245,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         self.set_m2m_connections(recipe, tags, ingredients)
         return recipe
 
+    @transaction.atomic
     def update(self, recipe, validated_data):
         recipe.image = validated_data.pop('image', recipe.image)
         tags = validated_data.pop('tags')
@@ -227,12 +254,43 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         return super().update(recipe, validated_data)
 
     def set_m2m_connections(self, recipe, tags, ingredients):
-        recipe.tags.set(tags, clear=True)
-        recipe.ingredients.clear()
+        """Apply difference between stored and given tags and ingredients.
+
+        Unchanged rows are kept, so readers never see a recipe without
+        them. Called inside transaction of create or update.
+        """
+        old_tag_ids = set(RecipeTag.objects.filter(
+            recipe=recipe).values_list('tag_id', flat=True))
+        new_tag_ids = {tag.id for tag in tags}
+        if old_tag_ids - new_tag_ids:
+            recipe.tags.remove(*(old_tag_ids - new_tag_ids))
+        if new_tag_ids - old_tag_ids:
+            recipe.tags.add(*(new_tag_ids - old_tag_ids))
+        old_rows = {row.ingredient_id: row
+                    for row in recipe.ingredient_many_table.only(
+                        'id', 'ingredient_id', 'amount')}
+        old_amounts = {ingredient_id: row.amount
+                       for ingredient_id, row in old_rows.items()}
+        new_amounts = {record['ingredient'].id: record['amount']
+                       for record in ingredients}
+        removed_ids = old_amounts.keys() - new_amounts.keys()
+        if removed_ids:
+            recipe.ingredient_many_table.filter(
+                ingredient_id__in=removed_ids).delete()
+        changed_rows = []
+        for ingredient_id, amount in new_amounts.items():
+            row = old_rows.get(ingredient_id)
+            if row is not None and row.amount != amount:
+                row.amount = amount
+                changed_rows.append(row)
+        if changed_rows:
+            RecipeIngredient.objects.bulk_update(changed_rows, ('amount',))
         RecipeIngredient.objects.bulk_create(
-            (RecipeIngredient(recipe=recipe, **record)
-                for record
-                in ingredients))
+            RecipeIngredient(recipe=recipe, **record)
+            for record in ingredients
+            if record['ingredient'].id not in old_amounts)
+        UserShoppingListIngredient.objects.change_recipe(
+            recipe.id, old_amounts, new_amounts)
 
     def to_representation(self, recipe):
         recipe.author.is_subscribed = False
@@ -244,9 +302,11 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
 class RecipeShortSerializer(serializers.ModelSerializer):
     """Serializer for short recipe info."""
 
+    image_variants = ImageVariantsField('image')
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
 class UserRecipeReadSerializer(UserReadSerializer):
@@ -259,12 +319,25 @@ class UserRecipeReadSerializer(UserReadSerializer):
         fields = UserReadSerializer.Meta.fields + ('recipes', 'recipes_count')
 
     def get_recipes(self, user):
-        try:
-            recipes_limit = int(self.context['request'].query_params.get(
-                'recipes_limit'))
-        except (ValueError, TypeError):
-            recipes_limit = None
-        serializer = RecipeShortSerializer(user.recipes, many=True)
-        if recipes_limit:
-            return serializer.data[:recipes_limit]
-        return serializer.data
+        # limited_recipes должны быть загружены заранее через
+        # UserViewSet.prefetch_limited_recipes, чтобы лимит recipes_limit
+        # применялся в БД, а не при сериализации
+        return RecipeShortSerializer(user.limited_recipes, many=True).data
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Serializer for ids of recipes changed by one request."""
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.MAX_BATCH_RECIPES)
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """Serializer for status and result of background job."""
+
+    class Meta:
+        model = Job
+        fields = ('id', 'name', 'status', 'attempts', 'result', 'created',
+                  'finished')
@@ -0,0 +1,247 @@
+from django.db.models import Prefetch
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from rest_framework.authtoken.models import Token
+
+from .catalogs import accepts_gzip
+from .relations import UserRelations
+from .row_serializers import get_recipe_rows, serialize_recipes
+from .serializers import RecipeReadSerializer
+from core.images import SOURCE_KEY
+from core.metrics import assert_query_budget
+from core.models import (Ingredient, Recipe, RecipeIngredient, RecipeTag,
+                         Subscription, Tag, User, UserRecipeFavorite,
+                         UserRecipeShoppingList, UserShoppingListIngredient)
+
+
+def create_user(username, **fields):
+    return User.objects.create_user(
+        username=username, email=f'{username}@example.org',
+        first_name=username, last_name=username, password='password',
+        **fields)
+
+
+def create_recipe(author, name, tags=(), ingredients=(), **fields):
+    recipe = Recipe.objects.create(
+        author=author, name=name, text=f'{name} text', cooking_time=10,
+        image=f'recipes/images/{name}.png', **fields)
+    RecipeTag.objects.bulk_create(
+        RecipeTag(recipe=recipe, tag=tag) for tag in tags)
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=amount)
+        for ingredient, amount in ingredients)
+    return recipe
+
+
+class RecipeRowsSerializationTest(TestCase):
+    """serialize_recipes gives RecipeReadSerializer representations."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = create_user('viewer')
+        cls.author = create_user('author')
+        cls.avatar_author = create_user(
+            'avatar_author', avatar='users/avatar.png',
+            avatar_variants={
+                SOURCE_KEY: 'users/avatar.png',
+                'avatar': {'webp': 'users/avatar.webp',
+                           'jpeg': 'users/avatar.jpeg'}})
+        # Варианты сделаны для прежнего аватара и не отдаются
+        cls.stale_avatar_author = create_user(
+            'stale_avatar_author', avatar='users/new.png',
+            avatar_variants={SOURCE_KEY: 'users/old.png',
+                             'avatar': {'webp': 'users/old.webp'}})
+        breakfast = Tag.objects.create(name='Завтрак', slug='breakfast')
+        dinner = Tag.objects.create(name='Ужин', slug='dinner')
+        salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        egg = Ingredient.objects.create(name='яйцо', measurement_unit='шт')
+        cls.tagged = create_recipe(
+            cls.author, 'tagged', (dinner, breakfast),
+            ((egg, 2), (salt, 5)),
+            image_variants={
+                SOURCE_KEY: 'recipes/images/tagged.png',
+                'card': {'webp': 'recipes/images/card.webp'},
+                'detail': {'webp': 'recipes/images/detail.webp'}})
+        cls.untagged = create_recipe(
+            cls.avatar_author, 'untagged', ingredients=((salt, 1),))
+        cls.empty = create_recipe(cls.stale_avatar_author, 'empty')
+        cls.relations = UserRelations(
+            favorite_ids=(cls.tagged.id,),
+            shopping_cart_ids=(cls.untagged.id,),
+            subscription_ids=(cls.avatar_author.id,))
+
+    def serialize_with_drf(self, relations, request=None):
+        recipes = relations.mark_recipes(list(
+            Recipe.objects.select_related('author').prefetch_related(
+                Prefetch('tags', queryset=Tag.objects.order_by('id')),
+                Prefetch(
+                    'ingredient_many_table',
+                    queryset=RecipeIngredient.objects.select_related(
+                        'ingredient').order_by('id')))))
+        return RecipeReadSerializer(
+            recipes, many=True, context={'request': request}).data
+
+    def assert_parity(self, relations, request=None):
+        for json_agg in (False, True):
+            with self.subTest(json_agg=json_agg), override_settings(
+                    RECIPE_FEED_JSON_AGG=json_agg):
+                actual = serialize_recipes(
+                    get_recipe_rows(Recipe.objects.all()), relations,
+                    request)
+                self.assertEqual(
+                    actual, self.serialize_with_drf(relations, request))
+
+    def test_anonymous(self):
+        self.assert_parity(UserRelations())
+
+    def test_authenticated(self):
+        self.assert_parity(self.relations)
+
+    def test_absolute_urls(self):
+        request = RequestFactory().get('/api/recipes/')
+        request.user = self.viewer
+        self.assert_parity(self.relations, request)
+
+    def test_edge_cases_are_present(self):
+        data = {recipe['name']: recipe for recipe in serialize_recipes(
+            get_recipe_rows(Recipe.objects.all()), self.relations)}
+        self.assertEqual(data['untagged']['tags'], [])
+        self.assertEqual(data['empty']['ingredients'], [])
+        self.assertIsNone(data['tagged']['author']['avatar'])
+        self.assertIsNotNone(data['untagged']['author']['avatar_variants'])
+        self.assertIsNone(data['empty']['author']['avatar_variants'])
+        self.assertTrue(data['untagged']['author']['is_subscribed'])
+        self.assertTrue(data['tagged']['is_favorited'])
+        self.assertTrue(data['untagged']['is_in_shopping_cart'])
+
+
+class QueryBudgetTest(TestCase):
+    """Number of queries of endpoints doesn't grow with number of rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = create_user('viewer')
+        cls.token = Token.objects.create(user=cls.viewer)
+        tags = [Tag.objects.create(name=f'tag{index}', slug=f'tag{index}')
+                for index in range(3)]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'ingredient{index}', measurement_unit='г')
+            for index in range(4)]
+        recipes = []
+        for author_index in range(3):
+            author = create_user(f'author{author_index}')
+            Subscription.objects.create(
+                subscriber=cls.viewer, subscription=author)
+            for recipe_index in range(3):
+                recipes.append(create_recipe(
+                    author, f'recipe{author_index}{recipe_index}', tags,
+                    ((ingredient, recipe_index + 1)
+                     for ingredient in ingredients)))
+        UserRecipeFavorite.objects.bulk_create(
+            UserRecipeFavorite(user=cls.viewer, recipe=recipe)
+            for recipe in recipes[::2])
+        UserRecipeShoppingList.objects.bulk_create(
+            UserRecipeShoppingList(user=cls.viewer, recipe=recipe)
+            for recipe in recipes[::3])
+        UserShoppingListIngredient.objects.add_recipes(
+            cls.viewer.id, [recipe.id for recipe in recipes[::3]])
+        cls.recipe = recipes[0]
+
+    def setUp(self):
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Token {self.token}'
+
+    def assert_budget(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        assert_query_budget(response)
+        return response
+
+    def test_recipe_list(self):
+        self.assert_budget('/api/recipes/')
+        self.assert_budget('/api/recipes/?is_favorited=1&tags=tag0')
+
+    def test_recipe_list_anonymous(self):
+        del self.client.defaults['HTTP_AUTHORIZATION']
+        self.assert_budget('/api/recipes/')
+
+    def test_recipe_retrieve(self):
+        self.assert_budget(f'/api/recipes/{self.recipe.id}/')
+
+    def test_subscriptions(self):
+        self.assert_budget('/api/users/subscriptions/')
+        self.assert_budget('/api/users/subscriptions/?recipes_limit=2')
+
+    def test_download_shopping_cart(self):
+        response = self.assert_budget(
+            '/api/recipes/download_shopping_cart/')
+        # Запрос строк выполняется при чтении потокового ответа
+        self.assertIn(
+            'ingredient', response.metrics.queries[-1].lower())
+
+
+class CountersTest(TestCase):
+    """Denormalized counters follow ORM, admin and cascade changes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.reader = create_user('reader')
+        cls.recipe = create_recipe(cls.author, 'recipe')
+
+    def get_counters(self):
+        self.author.refresh_from_db()
+        self.recipe.refresh_from_db()
+        return (self.author.recipes_count, self.author.subscribers_count,
+                self.recipe.favorites_count, self.recipe.in_carts_count)
+
+    def test_counters_of_created_and_deleted_reader(self):
+        Subscription.objects.create(
+            subscriber=self.reader, subscription=self.author)
+        UserRecipeFavorite.objects.create(user=self.reader, recipe=self.recipe)
+        UserRecipeShoppingList.objects.create(
+            user=self.reader, recipe=self.recipe)
+        self.assertEqual(self.get_counters(), (1, 1, 1, 1))
+        self.reader.delete()
+        self.assertEqual(self.get_counters(), (1, 0, 0, 0))
+
+    def test_recipe_of_author_with_zero_counter_is_deleted(self):
+        User.objects.filter(pk=self.author.pk).update(recipes_count=0)
+        token = Token.objects.create(user=self.author)
+        response = self.client.delete(
+            f'/api/recipes/{self.recipe.id}/',
+            HTTP_AUTHORIZATION=f'Token {token}')
+        self.assertEqual(response.status_code, 204)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 0)
+
+
+class AcceptsGzipTest(SimpleTestCase):
+
+    def test_gzip_is_accepted(self):
+        for header in ('gzip', 'gzip, deflate, br', 'br;q=1.0, GZIP;q=0.5',
+                       '*', 'br, *;q=0.1'):
+            with self.subTest(header=header):
+                self.assertTrue(accepts_gzip(header))
+
+    def test_gzip_is_refused(self):
+        for header in ('', 'identity', 'br, deflate', 'gzip;q=0',
+                       'gzip; q=0.000, br', '*, gzip;q=0', '*;q=0'):
+            with self.subTest(header=header):
+                self.assertFalse(accepts_gzip(header))
+
+
+class CatalogEncodingTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.create(name='Завтрак', slug='breakfast')
+
+    def test_gzip_with_zero_quality_is_not_sent(self):
+        gzipped = self.client.get('/api/tags/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        response = self.client.get(
+            '/api/tags/', HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertNotEqual(response['ETag'], gzipped['ETag'])
+        self.assertEqual(response.json()[0]['slug'], 'breakfast')
@@ -1,31 +1,50 @@
-import csv
-
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Count, F, Prefetch, Sum
-from django.http import FileResponse
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import mixins, permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.generics import get_object_or_404
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import reverse
 
 from . import serializers
+from .catalogs import ingredient_catalog, tag_catalog
+from .exceptions import ErrorException
+from .exporters import shopping_cart_response
 from .filters import OrderingSearchFilter, RecipeFilter
-from .m2m_model_actions import create_connection, delete_connection_n_response
+from .indexes import ingredient_index
+from .m2m_model_actions import (create_connection, create_connections,
+                                delete_connection_n_response,
+                                delete_connections)
+from .paginators import PageOrCursorPagination
 from .permissions import AuthorOnly, ReadOnly
+from .recipe_cache import get_recipe_cache, get_recipes_data
+from .relations import RelationsMixin, get_user_relations
+from .renderers import CSVRenderer, PlainTextRenderer
+from .row_serializers import get_recipe_rows, serialize_recipes
 from core import models
+from core.metrics import registry
 
 User = get_user_model()
 
 
 class UserViewSet(
+        RelationsMixin,
         mixins.CreateModelMixin,
         mixins.ListModelMixin,
         mixins.RetrieveModelMixin,
         viewsets.GenericViewSet):
     """ViewSet for user flows."""
 
+    queryset = User.objects.all()
+    mark_relations_method = 'mark_users'
+    # Не зависят от размера страницы, проверяются assert_query_budget
+    query_budgets = {'list': 5, 'retrieve': 4, 'me': 4, 'subscriptions': 6}
+
     @action(detail=False, permission_classes=(permissions.IsAuthenticated,))
     def me(self, request):
         self.kwargs['pk'] = request.user.id
@@ -41,14 +60,15 @@ class UserViewSet(
             user, data=request.data, context={
                 'request': request})
         serializer.is_valid(raise_exception=True)
-        if user.avatar:
-            user.avatar.delete(save=True)
         serializer.save()
         return Response(serializer.data)
 
     @avatar.mapping.delete
     def delete_avatar(self, request):
-        request.user.avatar.delete(save=True)
+        # Файл может использоваться другими записями, его удалит
+        # collect_media_garbage
+        request.user.avatar = None
+        request.user.save(update_fields=('avatar',))
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(('post',), detail=False,
@@ -70,14 +90,17 @@ class UserViewSet(
     @action(('post',), detail=True,
             permission_classes=(permissions.IsAuthenticated,))
     def subscribe(self, request, pk):
+        subscription = get_object_or_404(User, pk=pk)
+        if subscription == request.user:
+            raise ErrorException(settings.SELF_FOLLOW_MSG)
         return (create_connection(
             model=models.Subscription,
-            subscription=get_object_or_404(User, pk=pk),
+            subscription=subscription,
             subscriber=request.user)
             or Response(
             data=serializers.UserRecipeReadSerializer(
-                self.get_subscription_queryset().get(
-                    pk=pk),
+                self.prefetch_limited_recipes(self.mark_relations(
+                    (self.get_subscription_queryset().get(pk=pk),)))[0],
                 context={'request': request}).data,
             status=status.HTTP_201_CREATED))
 
@@ -89,15 +112,33 @@ class UserViewSet(
             subscriber=request.user)
 
     def get_subscription_queryset(self):
-        return self.get_queryset().annotate(
-            recipes_count=Count('recipes')).prefetch_related('recipes').filter(
-            is_subscribed=True)
+        return self.get_queryset().filter(
+            subscriptions_many_table__subscriber=self.request.user)
+
+    def get_recipes_limit(self):
+        try:
+            return int(self.request.query_params.get('recipes_limit'))
+        except (ValueError, TypeError):
+            return None
+
+    def prefetch_limited_recipes(self, authors):
+        recipes = models.Recipe.objects.filter(author__in=authors).only(
+            'id', 'name', 'image', 'image_variants', 'cooking_time',
+            'author_id')
+        recipes_limit = self.get_recipes_limit()
+        if recipes_limit and recipes_limit > 0:
+            recipes = recipes.limit_per_author(recipes_limit)
+        prefetch_related_objects(
+            authors,
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes'))
+        return authors
 
     def get_all_subscriptions_response(self, request):
         return self.get_paginated_response(
             serializers.UserRecipeReadSerializer(
-                self.paginate_queryset(
-                    self.get_subscription_queryset()),
+                self.prefetch_limited_recipes(
+                    self.paginate_queryset(
+                        self.get_subscription_queryset())),
                 context={'request': request},
                 many=True).data)
 
@@ -106,34 +147,57 @@ class UserViewSet(
             return serializers.UserReadSerializer
         return serializers.UserWriteSerializer
 
-    def get_queryset(self):
-        return User.objects.add_is_subscribed_annotate(
-            self.request.user.id)
-
 
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet for reading ingredients."""
 
     queryset = models.Ingredient.objects.all()
     serializer_class = serializers.IngredientSerializer
+    query_budgets = {'list': 2, 'retrieve': 2}
     filter_backends = (OrderingSearchFilter,)
     search_fields = ('^name', 'name')
     pagination_class = None
 
+    def list(self, request):
+        search_terms = OrderingSearchFilter().get_search_terms(request)
+        if not search_terms:
+            if request.accepted_renderer.format == 'json':
+                return ingredient_catalog.get_response(request)
+            return Response(ingredient_index.all())
+        return Response(ingredient_index.search(
+            search_terms, settings.INGREDIENT_SEARCH_LIMIT))
+
 
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet for reading tags."""
 
     queryset = models.Tag.objects.all()
     serializer_class = serializers.TagSerializer
+    query_budgets = {'list': 2, 'retrieve': 2}
     pagination_class = None
 
+    def list(self, request):
+        if request.accepted_renderer.format == 'json':
+            return tag_catalog.get_response(request)
+        return super().list(request)
+
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(RelationsMixin, viewsets.ModelViewSet):
     """ViewSet for recipes."""
 
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    pagination_class = PageOrCursorPagination
+    mark_relations_method = 'mark_recipes'
+    query_budgets = {
+        'list': 8,
+        'retrieve': 6,
+        'get_link': 1,
+        'favorite': 5,
+        'delete_favorite': 5,
+        'batch_favorite': 5,
+        'download_shopping_cart': 2,
+    }
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,
                           AuthorOnly | ReadOnly,)
     http_method_names = ('get', 'post', 'patch', 'delete')
@@ -143,18 +207,45 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return serializers.RecipeReadSerializer
         return serializers.RecipeWriteSerializer
 
+    def get_rows(self, recipes):
+        """Values rows of recipes for get_rows_data."""
+        if get_recipe_cache() is None:
+            return get_recipe_rows(recipes)
+        return recipes.values('id', 'author_id', 'pub_date')
+
+    def get_rows_data(self, rows):
+        if get_recipe_cache() is None:
+            return serialize_recipes(
+                rows, get_user_relations(self.request), self.request)
+        return get_recipes_data(self.request, rows)
+
+    def list(self, request):
+        page = self.paginator.paginate_queryset(
+            self.get_rows(self.filter_queryset(models.Recipe.objects.all())),
+            request,
+            view=self)
+        return self.get_paginated_response(self.get_rows_data(page))
+
+    def retrieve(self, request, pk):
+        return Response(self.get_rows_data((get_object_or_404(
+            self.get_rows(models.Recipe.objects.all()), pk=pk),))[0])
+
     def get_queryset(self):
-        return (models.Recipe.objects.prefetch_related(
-            Prefetch(
-                'author',
-                queryset=User.objects.add_is_subscribed_annotate(
-                    self.request.user.id)),
-            'tags',
+        return models.Recipe.objects.select_related('author').prefetch_related(
+            Prefetch('tags', queryset=models.Tag.objects.order_by('id')),
             Prefetch(
                 'ingredient_many_table',
                 queryset=models.RecipeIngredient.
-                objects.select_related('ingredient'))).
-                add_all_annotations(self.request.user.id))
+                objects.select_related('ingredient').order_by('id')))
+
+    @transaction.atomic
+    def perform_destroy(self, recipe):
+        shopping_list_ingredients = models.UserShoppingListIngredient.objects
+        shopping_list_ingredients.change_recipe(
+            recipe.id,
+            shopping_list_ingredients.get_recipes_amounts((recipe.id,)),
+            {})
+        super().perform_destroy(recipe)
 
     @action(detail=True, url_path='get-link')
     def get_link(self, request, pk):
@@ -190,39 +281,104 @@ class RecipeViewSet(viewsets.ModelViewSet):
             permission_classes=(permissions.IsAuthenticated,))
     def shopping_cart(self, request, pk):
         recipe = get_object_or_404(models.Recipe, pk=pk)
-        return (create_connection(
-            model=models.UserRecipeShoppingList,
-            recipe=recipe,
-            user=request.user)
-            or Response(
+        with transaction.atomic():
+            create_connection(
+                model=models.UserRecipeShoppingList,
+                recipe=recipe,
+                user=request.user)
+            models.UserShoppingListIngredient.objects.add_recipe(
+                request.user.id, recipe.id)
+        return Response(
             data=serializers.RecipeShortSerializer(
                 recipe,
                 context={'request': request}).data,
-            status=status.HTTP_201_CREATED))
+            status=status.HTTP_201_CREATED)
 
     @shopping_cart.mapping.delete
     def delete_from_shopping_cart(self, request, pk):
-        return delete_connection_n_response(
+        recipe = get_object_or_404(models.Recipe, pk=pk)
+        with transaction.atomic():
+            response = delete_connection_n_response(
+                models.UserRecipeShoppingList,
+                recipe=recipe,
+                user=request.user)
+            models.UserShoppingListIngredient.objects.remove_recipe(
+                request.user.id, recipe.id)
+        return response
+
+    def get_batch_response(self, change_connections, model, changed=None):
+        """Apply batch change of user links to recipes from request body.
+
+        changed(user_id, recipe_ids) is called for actually changed links
+        in the same transaction.
+        """
+        serializer = serializers.RecipeIdsSerializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            outcomes, changed_ids = change_connections(
+                model,
+                self.request.user.id,
+                serializer.validated_data['recipes'])
+            if changed is not None:
+                changed(self.request.user.id, changed_ids)
+        return Response({'recipes': outcomes})
+
+    @action(methods=('post',), detail=False, url_path='favorite',
+            permission_classes=(permissions.IsAuthenticated,))
+    def batch_favorite(self, request):
+        return self.get_batch_response(
+            create_connections, models.UserRecipeFavorite)
+
+    @batch_favorite.mapping.delete
+    def batch_delete_favorite(self, request):
+        return self.get_batch_response(
+            delete_connections, models.UserRecipeFavorite)
+
+    @action(methods=('post',), detail=False, url_path='shopping_cart',
+            permission_classes=(permissions.IsAuthenticated,))
+    def batch_shopping_cart(self, request):
+        return self.get_batch_response(
+            create_connections,
             models.UserRecipeShoppingList,
-            recipe=get_object_or_404(
-                models.Recipe,
-                pk=pk),
-            user=request.user)
+            models.UserShoppingListIngredient.objects.add_recipes)
+
+    @batch_shopping_cart.mapping.delete
+    def batch_delete_from_shopping_cart(self, request):
+        return self.get_batch_response(
+            delete_connections,
+            models.UserRecipeShoppingList,
+            models.UserShoppingListIngredient.objects.remove_recipes)
 
     @action(detail=False,
-            permission_classes=(permissions.IsAuthenticated,))
+            permission_classes=(permissions.IsAuthenticated,),
+            renderer_classes=(CSVRenderer, PlainTextRenderer, JSONRenderer))
     def download_shopping_cart(self, request):
-        ingredients = models.RecipeIngredient.objects.filter(
-            recipe__in_shopping_list_by=request.user).values(
-            ingredients_name=F('ingredient__name'),
-            measurement_unit=F('ingredient__measurement_unit')).annotate(
-            total_amount=Sum('amount'))
-        with open('temp.csv', 'w', newline='') as csvfile:
-            fieldnames = (
-                'Название ингредиента',
-                'Единицы измерения',
-                'Количество')
-            writer = csv.writer(csvfile)
-            writer.writerow(fieldnames)
-            writer.writerows(ingredient.values() for ingredient in ingredients)
-        return FileResponse(open('temp.csv', 'rb'), as_attachment=True)
+        ingredients = request.user.shopping_list_ingredients.values_list(
+            'ingredient__name',
+            'ingredient__measurement_unit',
+            'total_amount').order_by('ingredient__name')
+        return shopping_cart_response(
+            ingredients.iterator(
+                chunk_size=settings.SHOPPING_CART_EXPORT_CHUNK_SIZE),
+            request.accepted_renderer)
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    """ViewSet for polling background jobs of user."""
+
+    serializer_class = serializers.JobSerializer
+    query_budgets = {'list': 4, 'retrieve': 4}
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get_queryset(self):
+        return self.request.user.jobs.all()
+
+
+class MetricsView(APIView):
+    """Request histograms of this process in Prometheus text format."""
+
+    permission_classes = (permissions.IsAdminUser,)
+    renderer_classes = (PlainTextRenderer,)
+
+    def get(self, request):
+        return Response(registry.render())
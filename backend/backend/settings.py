@@ -25,6 +25,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework.authtoken',
     'rest_framework',
     'djoser',
@@ -34,6 +35,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.QueryMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -66,7 +68,7 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'core.backends.postgresql',
         'NAME': os.getenv('POSTGRES_DB', 'django'),
         'USER': os.getenv('POSTGRES_USER', 'django'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
@@ -74,6 +76,16 @@ DATABASES = {
         'PORT': os.getenv('DB_PORT', 5432)
     }
 }
+# Соединения с базой берутся из пула процесса (core.backends.postgresql),
+# CONN_MAX_AGE остаётся 0: в конце запроса соединение возвращается в пул
+# и достаётся следующему запросу любого потока. DB_POOL_SIZE=0 отключает
+# пул, размер должен покрывать число потоков воркера
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+# Ожидание свободного соединения, после него запрос падает с ошибкой
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+DB_POOL_MAX_LIFETIME = 60 * 60
+# Соединение, простоявшее в пуле дольше, проверяется запросом SELECT 1
+DB_POOL_CHECK_INTERVAL = 30
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -109,6 +121,10 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Файлы называются по хешу содержимого и не дублируются, на них
+# считаются ссылки записей (core.MediaBlob)
+DEFAULT_FILE_STORAGE = 'core.storages.ContentAddressedStorage'
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'core.User'
@@ -146,21 +162,82 @@ MAX_EMAIL_LENGTH = 254
 MAX_RECIPE_NAME = 256
 MIN_COOKING_TIME = 1
 MIN_AMOUNT = 1
-MSG_SELF_FOLLOW_ERROR = 'CHECK constraint failed: prevent_self_follow'
-MSG_ALREADY_SUBSCRIBED_ERROR = (
-    'UNIQUE constraint failed: '
-    'core_subscription.subscription_id, core_subscription.subscriber_id')
-MSG_ALREADY_FAVORE_ERROR = (
-    'UNIQUE constraint failed: '
-    'core_userrecipefavorite.recipe_id, core_userrecipefavorite.user_id')
-MSG_ALREADY_IN_SHOPPING_LIST = (
-    'UNIQUE constraint failed: '
-    'core_userrecipeshoppinglist.recipe_id, '
-    'core_userrecipeshoppinglist.user_id')
-ERROR_M2M_CONNECTION_MSGS = {
-    MSG_SELF_FOLLOW_ERROR: 'User can\'t subscribe himself',
-    MSG_ALREADY_SUBSCRIBED_ERROR: 'You are already subscribed',
-    MSG_ALREADY_FAVORE_ERROR: 'You are already favore it',
-    MSG_ALREADY_IN_SHOPPING_LIST: 'You are already added it in shoppind list'
+SELF_FOLLOW_MSG = 'User can\'t subscribe himself'
+ALREADY_CONNECTED_MSGS = {
+    'Subscription': 'You are already subscribed',
+    'UserRecipeFavorite': 'You are already favore it',
+    'UserRecipeShoppingList': 'You are already added it in shoppind list'
 }
 NOT_CONNECTED_MSG = 'You were not linked that way to it'
+MAX_BATCH_RECIPES = 100
+# Ключ перемешивания id в коротких ссылках. Без него id кодируется как
+# есть, и ссылки на рецепты с id меньше 256 остаются прежними
+SHORT_LINK_KEY = os.getenv('SHORT_LINK_KEY')
+# Число путей коротких ссылок, разбор которых кешируется в процессе
+SHORT_LINK_CACHE_SIZE = 100000
+SHOPPING_CART_FILENAME = 'shopping_cart'
+SHOPPING_CART_HEADERS = (
+    'Название ингредиента',
+    'Единицы измерения',
+    'Количество')
+SHOPPING_CART_EXPORT_CHUNK_SIZE = 2000
+INGREDIENT_SEARCH_LIMIT = 50
+LOAD_BATCH_SIZE = 1000
+# Варианты изображений (размер не больше указанного) создаются фоновой
+# задачей после сохранения
+IMAGE_VARIANT_SIZES = {
+    'card': (480, 480),
+    'detail': (1280, 1280),
+    'avatar': (256, 256),
+}
+IMAGE_VARIANT_FORMATS = ('webp', 'jpeg')
+IMAGE_VARIANT_QUALITY = 80
+# Фоновые задачи (core.jobs) хранятся в базе и выполняются командой
+# run_workers, при JOBS_EAGER - сразу после коммита поставившим их
+# процессом (разработка без воркеров)
+JOBS_EAGER = os.getenv('JOBS_EAGER', 'False').lower() == 'true'
+JOB_WORKER_THREADS = int(os.getenv('JOB_WORKER_THREADS', 2))
+JOB_POLL_INTERVAL = 1
+JOB_MAX_ATTEMPTS = 3
+# Повторная попытка откладывается на JOB_RETRY_DELAY * 2 ** (попытка - 1)
+JOB_RETRY_DELAY = 30
+# Задача, выполняющаяся дольше, считается брошенной упавшим воркером
+JOB_TIMEOUT = 15 * 60
+# Файлы без ссылок удаляются, если не менялись дольше этого времени
+# (загрузка могла ещё не закоммитить запись)
+MEDIA_GC_GRACE_PERIOD = 60 * 60
+LOAD_LOOKUP_CACHE_SIZE = 100000
+# generate_data: число избранного, подписок и покупок пользователя не
+# больше среднего, умноженного на это число
+GENERATE_MAX_COUNT_RATIO = 50
+RECIPE_SEARCH_CONFIG = 'russian'
+# Связи пользователя (избранное, покупки, подписки) загружаются один раз
+# на запрос. Если указан алиас общего для всех воркеров кеша (Redis,
+# Memcached), они кешируются между запросами с версионированием ключей
+USER_RELATIONS_CACHE_ALIAS = os.getenv('USER_RELATIONS_CACHE_ALIAS')
+USER_RELATIONS_CACHE_TIMEOUT = 60 * 60
+# Общие для всех пользователей части рецептов кешируются только в общем
+# для всех воркеров кеше, так как сброс версий должен быть виден всем
+RECIPE_CACHE_ALIAS = os.getenv('RECIPE_CACHE_ALIAS')
+RECIPE_CACHE_TIMEOUT = 24 * 60 * 60
+# Только для Postgres: страница рецептов вместе с тегами, ингредиентами и
+# автором собирается в JSON одним запросом (json_agg)
+RECIPE_FEED_JSON_AGG = os.getenv(
+    'RECIPE_FEED_JSON_AGG', 'False').lower() == 'true'
+# Индекс ингредиентов перестраивается по сигналам только в том процессе,
+# где ингредиент изменили, остальные воркеры перестраивают его по таймауту
+INGREDIENT_INDEX_TTL = 300
+# ETag справочников тегов и ингредиентов - хеш содержимого, одинаковый во
+# всех воркерах. Версии (Last-Modified) хранятся в общем кеше, без него
+# Last-Modified не отдаётся, а готовые ответы перестраиваются так же, как
+# индекс
+CATALOG_CACHE_ALIAS = os.getenv('CATALOG_CACHE_ALIAS')
+CATALOG_PAYLOAD_TTL = 300
+# Число запросов к базе и время ответов по представлениям собираются в
+# гистограммы каждого процесса (api/metrics/ для администраторов)
+METRICS_PREFIX = 'foodgram'
+METRICS_SERVER_TIMING = os.getenv(
+    'METRICS_SERVER_TIMING', 'True').lower() == 'true'
+METRICS_DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS_QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
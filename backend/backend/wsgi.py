@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+from core.short_links import ShortLinkApplication  # noqa: E402
+
+application = ShortLinkApplication(application)
@@ -0,0 +1,129 @@
+import json
+import platform
+import random
+import subprocess
+import threading
+import time
+from datetime import datetime, timezone
+
+import django
+from django.db import connection, connections
+
+from .scenarios import SCENARIOS
+
+
+def get_percentile(sorted_values, percent):
+    """Nearest-rank percentile of sorted values."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(samples, wall_time):
+    durations = sorted(duration for duration, _, _ in samples)
+    queries = [count for _, _, count in samples if count is not None]
+    return {
+        'requests': len(samples),
+        'errors': sum(status >= 400 for _, status, _ in samples),
+        'rps': round(len(samples) / wall_time, 1) if wall_time else None,
+        **{f'p{percent}_ms': round(
+            get_percentile(durations, percent) * 1000, 2)
+           for percent in (50, 95, 99)},
+        'mean_ms': round(sum(durations) / len(durations) * 1000, 2),
+        'max_ms': round(durations[-1] * 1000, 2),
+        'queries_mean': (round(sum(queries) / len(queries), 2)
+                         if queries else None),
+        'queries_max': max(queries) if queries else None,
+    }
+
+
+def timed_send(transport, request):
+    started = time.perf_counter()
+    status, queries = transport.send(request)
+    return time.perf_counter() - started, status, queries
+
+
+def send_in_thread(transport, requests, samples):
+    try:
+        samples.extend([timed_send(transport, request)
+                        for request in requests])
+    finally:
+        connections.close_all()
+
+
+def run_scenario(transport, name, data, seed, requests, warmup,
+                 concurrency):
+    """Send planned requests of scenario, warmup ones are not measured.
+
+    Requests are planned before sending by random generator seeded with
+    scenario name, so runs with equal data send the same requests.
+    """
+    rng = random.Random(f'{seed}:{name}')
+    plan = [SCENARIOS[name](rng, data) for _ in range(warmup + requests)]
+    for request in plan[:warmup]:
+        transport.send(request)
+    started = time.perf_counter()
+    if concurrency == 1:
+        samples = [timed_send(transport, request)
+                   for request in plan[warmup:]]
+    else:
+        # Каждый поток отправляет свою часть запросов по порядку
+        samples = []
+        threads = [
+            threading.Thread(target=send_in_thread, args=(
+                transport, plan[warmup + index::concurrency], samples))
+            for index in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return summarize(samples, time.perf_counter() - started)
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_environment(options):
+    return {
+        'commit': get_commit(),
+        'started': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        **options,
+    }
+
+
+def compare(previous, current):
+    """Lines with change of p50, p95, p99 and queries between results."""
+    lines = []
+    for transport, scenarios in current['results'].items():
+        for name, summary in scenarios.items():
+            old = previous.get('results', {}).get(transport, {}).get(name)
+            if old is None:
+                continue
+            changes = []
+            for key in ('p50_ms', 'p95_ms', 'p99_ms', 'queries_mean'):
+                if old.get(key) and summary.get(key) is not None:
+                    changes.append(
+                        f'{key} {old[key]} -> {summary[key]} '
+                        f'({(summary[key] / old[key] - 1) * 100:+.1f}%)')
+            lines.append(f'{transport} {name}: {", ".join(changes)}')
+    return lines
+
+
+def load_results(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_results(path, results):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(results, file, ensure_ascii=False, indent=2)
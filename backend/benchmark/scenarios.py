@@ -0,0 +1,124 @@
+import base64
+import io
+import json
+from urllib.parse import quote
+
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from core.models import Ingredient, Recipe, Tag
+
+
+def get_image_data(size=(64, 64)):
+    """Base64 image of created recipes, variants are made by jobs."""
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (90, 160, 60)).save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+IMAGE = get_image_data()
+
+
+class Request:
+    """Planned request of scenario, token is None for anonymous."""
+
+    def __init__(self, method, path, token=None, body=None):
+        self.method = method
+        self.path = path
+        self.token = token
+        self.body = None if body is None else json.dumps(body)
+
+
+class BenchmarkData:
+    """Ids and tokens of seeded database which scenarios choose from."""
+
+    def __init__(self):
+        tokens = dict(Token.objects.values_list('user_id', 'key'))
+        self.tokens = [tokens[user_id] for user_id in sorted(tokens)]
+        self.recipes_by_token = {}
+        for author_id, recipe_id in Recipe.objects.order_by(
+                'id').values_list('author_id', 'id'):
+            if author_id in tokens:
+                self.recipes_by_token.setdefault(
+                    tokens[author_id], []).append(recipe_id)
+        self.authors = sorted(self.recipes_by_token)
+        self.author_ids = sorted(
+            user_id for user_id, token in tokens.items()
+            if token in self.recipes_by_token)
+        self.ingredients = list(Ingredient.objects.order_by(
+            'id').values_list('id', 'name'))
+        self.tags = list(Tag.objects.order_by('id').values_list(
+            'id', 'slug'))
+        self.recipe_pages = max(1, Recipe.objects.count() // 6)
+
+
+def get_recipe_body(rng, data):
+    return {
+        'tags': [tag_id for tag_id, _ in rng.sample(
+            data.tags, rng.randint(1, 2))],
+        'ingredients': [
+            {'id': ingredient_id, 'amount': rng.randint(1, 500)}
+            for ingredient_id, _ in rng.sample(
+                data.ingredients, rng.randint(3, 10))],
+        'name': f'Рецепт {rng.randint(1, 10 ** 6)}',
+        'text': 'Описание рецепта для нагрузочного теста',
+        'cooking_time': rng.randint(1, 180)}
+
+
+def feed(rng, data):
+    page = rng.randint(1, min(data.recipe_pages, 100))
+    return Request('get', f'/api/recipes/?page={page}&limit=6')
+
+
+def filtered_feed(rng, data):
+    filters = [f'tags={slug}' for _, slug in rng.sample(data.tags, 2)]
+    if rng.random() < 0.3:
+        filters.append(f'author={rng.choice(data.author_ids)}')
+    token = rng.choice(data.tokens)
+    if rng.random() < 0.3:
+        filters.append('is_favorited=1')
+    return Request(
+        'get', f'/api/recipes/?limit=6&{"&".join(filters)}', token)
+
+
+def ingredient_autocomplete(rng, data):
+    _, name = rng.choice(data.ingredients)
+    return Request(
+        'get', f'/api/ingredients/?name={quote(name[:rng.randint(1, 4)])}')
+
+
+def subscriptions(rng, data):
+    return Request(
+        'get', '/api/users/subscriptions/?recipes_limit=3',
+        rng.choice(data.tokens))
+
+
+def cart_download(rng, data):
+    return Request(
+        'get', '/api/recipes/download_shopping_cart/',
+        rng.choice(data.tokens))
+
+
+def recipe_create(rng, data):
+    body = get_recipe_body(rng, data)
+    body['image'] = IMAGE
+    return Request('post', '/api/recipes/', rng.choice(data.tokens), body)
+
+
+def recipe_patch(rng, data):
+    token = rng.choice(data.authors)
+    recipe_id = rng.choice(data.recipes_by_token[token])
+    return Request('patch', f'/api/recipes/{recipe_id}/', token,
+                   get_recipe_body(rng, data))
+
+
+SCENARIOS = {
+    'feed': feed,
+    'filtered_feed': filtered_feed,
+    'ingredient_autocomplete': ingredient_autocomplete,
+    'subscriptions': subscriptions,
+    'cart_download': cart_download,
+    'recipe_create': recipe_create,
+    'recipe_patch': recipe_patch,
+}
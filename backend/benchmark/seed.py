@@ -0,0 +1,46 @@
+from django.db import connection, transaction
+from rest_framework.authtoken.models import Token
+
+from core.management.commands._generators import (GENERATED_MODELS,
+                                                  DataGenerator)
+from core.management.commands._loaders import refresh_denormalized
+from core.models import User
+from core.signals import bulk_loaded
+
+DEFAULT_SCALE = {
+    'users': 200,
+    'recipes': 2000,
+    # Средние числа на пользователя
+    'favorites': 20,
+    'subscriptions': 5,
+    'carts': 5,
+}
+
+
+@transaction.atomic
+def seed(scale, seed=1):
+    """Fill empty database with deterministic data of given scale.
+
+    Data is made by generator of generate_data command, counters and
+    other denormalized data are refreshed as after it. Token of every
+    user is get_token(username).
+    """
+    # Тестовую базу никто, кроме нагрузочного теста, не читает, поэтому
+    # внешние ключи на время записи удаляются
+    is_postgresql = connection.vendor == 'postgresql'
+    DataGenerator(
+        'copy' if is_postgresql else 'bulk', seed,
+        drop_foreign_keys=is_postgresql).generate(
+        scale['users'], scale['recipes'], scale['favorites'],
+        scale['subscriptions'], scale['carts'])
+    Token.objects.bulk_create(
+        Token(key=get_token(username), user_id=user_id)
+        for user_id, username in User.objects.values_list('id', 'username'))
+    refresh_denormalized(set(GENERATED_MODELS))
+    for model in GENERATED_MODELS:
+        transaction.on_commit(
+            lambda model=model: bulk_loaded.send(sender=model))
+
+
+def get_token(username):
+    return f'{username}-'.ljust(40, '0')
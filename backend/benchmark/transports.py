@@ -0,0 +1,122 @@
+import http.client
+import re
+import threading
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from django.db import connections
+from django.test import Client
+
+from backend.wsgi import application
+
+QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def get_queries(server_timing):
+    """Query count from Server-Timing header of QueryMetricsMiddleware."""
+    match = QUERIES.search(server_timing or '')
+    return int(match[1]) if match else None
+
+
+def get_headers(request):
+    headers = {}
+    if request.token:
+        headers['Authorization'] = f'Token {request.token}'
+    if request.body is not None:
+        headers['Content-Type'] = 'application/json'
+    return headers
+
+
+class ClientTransport:
+    """Requests through Django test client, without HTTP and WSGI."""
+
+    name = 'client'
+
+    def __enter__(self):
+        self.local = threading.local()
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def send(self, request):
+        if not hasattr(self.local, 'client'):
+            self.local.client = Client()
+        extra = {f'HTTP_{name.upper()}': value
+                 for name, value in get_headers(request).items()
+                 if name != 'Content-Type'}
+        response = self.local.client.generic(
+            request.method.upper(), request.path, request.body or '',
+            content_type='application/json', **extra)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        # Метрики потокового ответа дописываются при чтении тела, а
+        # заголовок Server-Timing он не получает
+        metrics = getattr(response, 'metrics', None)
+        if metrics is not None:
+            return response.status_code, len(metrics.queries)
+        return response.status_code, get_queries(
+            response.get('Server-Timing'))
+
+
+class QuietHandler(WSGIRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+    def process_request_thread(self, request, client_address):
+        # Поток создаётся на каждое соединение, его соединение с базой
+        # закрывается и при CONN_MAX_AGE > 0
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            connections.close_all()
+
+
+class WSGIServerTransport:
+    """Requests over HTTP to local WSGI server of project application.
+
+    Query count is taken from Server-Timing header, so it is None for
+    streaming responses (shopping cart download), which don't get it.
+    """
+
+    name = 'wsgi'
+
+    def __enter__(self):
+        self.server = make_server(
+            '127.0.0.1', 0, application,
+            server_class=ThreadingWSGIServer, handler_class=QuietHandler)
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def send(self, request):
+        # Сервер wsgiref закрывает соединение после каждого ответа
+        connection = http.client.HTTPConnection(
+            *self.server.server_address)
+        try:
+            connection.request(
+                request.method.upper(), request.path,
+                body=None if request.body is None
+                else request.body.encode(),
+                headers=get_headers(request))
+            response = connection.getresponse()
+            response.read()
+            return response.status, get_queries(
+                response.getheader('Server-Timing'))
+        finally:
+            connection.close()
+
+
+TRANSPORTS = {
+    transport.name: transport
+    for transport in (ClientTransport, WSGIServerTransport)}
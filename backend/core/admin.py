@@ -1,5 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.db.models import F, Q
+from django.utils import timezone
 
 from . import models
 
@@ -8,18 +10,27 @@ class SearchableUserAdmin(UserAdmin):
     """Custom display for user model in admin zone."""
 
     search_fields = ('username', 'email')
+    list_display = UserAdmin.list_display + (
+        'recipes_count', 'subscribers_count')
 
 
 class RecipeAdmin(admin.ModelAdmin):
     """Custom display for recipe model in admin zone."""
 
     search_fields = ('author__username', 'name')
+    list_display = ('name', 'author', 'favorites_count', 'in_carts_count')
     list_filter = ('tags',)
     readonly_fields = ('is_favorited_count',)
 
+    def get_search_results(self, request, recipes, search_term):
+        if not search_term:
+            return recipes, False
+        return recipes.search(
+            search_term, Q(author__username=search_term)), False
+
     @admin.display(description='Количество добавленных в избранное')
     def is_favorited_count(self, recipe):
-        return recipe.favorited_by.count()
+        return recipe.favorites_count
 
 
 class IngredientAdmin(admin.ModelAdmin):
@@ -29,12 +40,42 @@ class IngredientAdmin(admin.ModelAdmin):
     search_fields = ('name',)
 
 
+class MediaBlobAdmin(admin.ModelAdmin):
+    """Custom display for stored files in admin zone."""
+
+    list_display = ('name', 'references_count')
+    search_fields = ('name',)
+    readonly_fields = ('name', 'references_count')
+
+
+class JobAdmin(admin.ModelAdmin):
+    """Custom display for background jobs in admin zone."""
+
+    list_display = ('name', 'status', 'user', 'attempts', 'created',
+                    'finished', 'worker')
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'user__username')
+    readonly_fields = ('status', 'attempts', 'result', 'error', 'worker',
+                       'created', 'started', 'finished')
+    actions = ('retry',)
+
+    @admin.action(description='Повторить выбранные задачи')
+    def retry(self, request, jobs):
+        jobs.exclude(status=models.Job.RUNNING).update(
+            status=models.Job.QUEUED,
+            run_after=timezone.now(),
+            max_attempts=F('attempts') + 1)
+
+
 admin.site.register(models.Subscription)
 admin.site.register(models.Tag)
 admin.site.register(models.Ingredient, IngredientAdmin)
 admin.site.register(models.RecipeIngredient)
 admin.site.register(models.UserRecipeShoppingList)
 admin.site.register(models.UserRecipeFavorite)
+admin.site.register(models.UserShoppingListIngredient)
 admin.site.register(models.RecipeTag)
 admin.site.register(models.Recipe, RecipeAdmin)
 admin.site.register(models.User, SearchableUserAdmin)
+admin.site.register(models.MediaBlob, MediaBlobAdmin)
+admin.site.register(models.Job, JobAdmin)
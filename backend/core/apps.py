@@ -1,7 +1,25 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save, pre_save
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
     verbose_name = 'Основные модели'
+
+    def ready(self):
+        from .counters import count_created, count_deleted
+        from .media import count_media, release_media, remember_media
+        from .models import (Recipe, Subscription, User, UserRecipeFavorite,
+                             UserRecipeShoppingList)
+        from .tasks import schedule_processing
+
+        for model in (Recipe, User):
+            pre_save.connect(remember_media, sender=model)
+            post_save.connect(count_media, sender=model)
+            post_delete.connect(release_media, sender=model)
+            post_save.connect(schedule_processing, sender=model)
+        for model in (Recipe, Subscription, UserRecipeFavorite,
+                      UserRecipeShoppingList):
+            post_save.connect(count_created, sender=model)
+            post_delete.connect(count_deleted, sender=model)
@@ -0,0 +1,78 @@
+from django.conf import settings
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base, creation
+from psycopg2 import extensions
+
+from ...db_pool import PoolTimeout, close_pools, get_pool
+
+Database = base.Database
+
+
+def check_connection(connection):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+    connection.rollback()
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Соединения пула не дают удалить тестовую базу
+        close_pools(test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """PostgreSQL backend taking connections from pool of process.
+
+    Django closes connection at the end of request (CONN_MAX_AGE = 0),
+    here it is returned to pool and is reused by next request of any
+    thread. DB_POOL_SIZE = 0 turns pool off.
+    """
+
+    creation_class = DatabaseCreation
+    pool = None
+
+    def get_new_connection(self, conn_params):
+        if not settings.DB_POOL_SIZE or self.alias == NO_DB_ALIAS:
+            return super().get_new_connection(conn_params)
+        pool = get_pool(
+            self.alias, conn_params,
+            lambda: super(DatabaseWrapper, self).get_new_connection(
+                conn_params),
+            check_connection)
+        try:
+            connection = pool.acquire()
+        except PoolTimeout as error:
+            raise Database.OperationalError(str(error)) from error
+        self.pool = pool
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level)
+        return connection
+
+    def reset_connection(self):
+        """Rollback unfinished transaction before connection is reused."""
+        if self.in_atomic_block or self.connection.closed:
+            return False
+        status = self.connection.get_transaction_status()
+        if status == extensions.TRANSACTION_STATUS_IDLE:
+            return True
+        if status not in (extensions.TRANSACTION_STATUS_INTRANS,
+                          extensions.TRANSACTION_STATUS_INERROR):
+            return False
+        # rollback() соединения в режиме autocommit ничего не отправляет,
+        # а транзакция могла быть начата запросом BEGIN
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute('ROLLBACK')
+        except Database.Error:
+            return False
+        return True
+
+    def _close(self):
+        if self.pool is None or self.connection is None:
+            return super()._close()
+        pool, self.pool = self.pool, None
+        # Закрытое в транзакции соединение остаётся у обёртки
+        # (closed_in_transaction) и в пул не возвращается
+        pool.release(self.connection, self.reset_connection())
@@ -1,5 +1,65 @@
+import hashlib
+from functools import lru_cache
+
+from django.conf import settings
 from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 
+# BigAutoField хранит id в 8 байтах со знаком
+MAX_ID_LENGTH = 8
+MAX_ID = 2 ** 63 - 1
+
+
+@lru_cache(maxsize=None)
+def get_scramble_parameters(key, length):
+    """Modulus, odd multiplier, its inverse and mask for length bytes."""
+    modulus = 1 << (8 * length)
+    digest = hashlib.sha256(key.encode()).digest()
+    multiplier = int.from_bytes(digest[:8], 'big') % modulus | 1
+    mask = int.from_bytes(digest[8:16], 'big') % modulus
+    return modulus, multiplier, pow(multiplier, -1, modulus), mask
+
+
+def scramble(number, length, key):
+    """Bijection of numbers of length bytes, hides sequence of ids."""
+    modulus, multiplier, _, mask = get_scramble_parameters(key, length)
+    number = (number ^ mask) * multiplier % modulus
+    # Сдвиг на половину разрядов сам себе обратен
+    number ^= number >> (4 * length)
+    return number * multiplier % modulus
+
+
+def unscramble(number, length, key):
+    modulus, _, inverse, mask = get_scramble_parameters(key, length)
+    number = number * inverse % modulus
+    number ^= number >> (4 * length)
+    return number * inverse % modulus ^ mask
+
+
+def encode_id(number):
+    """Urlsafe base64 of id in as few bytes as it needs.
+
+    With SHORT_LINK_KEY bytes are scrambled, without it ids below 256
+    give the same codes as before variable length was supported.
+    """
+    number = int(number)
+    length = max(1, (number.bit_length() + 7) // 8)
+    if settings.SHORT_LINK_KEY:
+        number = scramble(number, length, settings.SHORT_LINK_KEY)
+    return urlsafe_base64_encode(number.to_bytes(length, 'big'))
+
+
+def decode_id(code):
+    """Id encoded by encode_id, ValueError for invalid codes."""
+    data = urlsafe_base64_decode(code)
+    if not 0 < len(data) <= MAX_ID_LENGTH:
+        raise ValueError(f'Code of {len(data)} bytes')
+    number = int.from_bytes(data, 'big')
+    if settings.SHORT_LINK_KEY:
+        number = unscramble(number, len(data), settings.SHORT_LINK_KEY)
+    if number > MAX_ID:
+        raise ValueError('Code is out of id range')
+    return number
+
 
 class Base64Converter:
     """URL path convertor urlsafe_base64 to integer."""
@@ -7,7 +67,7 @@ class Base64Converter:
     regex = '[A-Za-z0-9_-]+=*'
 
     def to_python(self, b64_number):
-        return int.from_bytes(urlsafe_base64_decode(b64_number))
+        return decode_id(b64_number)
 
     def to_url(self, id):
-        return urlsafe_base64_encode(int(id).to_bytes())
+        return encode_id(id)
@@ -0,0 +1,33 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+
+def shift_counter(queryset, counter_name, step):
+    """Change denormalized counter of objects, it doesn't go below zero."""
+    return queryset.update(
+        **{counter_name: Greatest(F(counter_name) + step, 0)})
+
+
+def shift_connection_counters(connection, step):
+    """Change counters of objects linked by instance (COUNTERS of model)."""
+    for field_name, counter_name in connection.COUNTERS.items():
+        field = connection._meta.get_field(field_name)
+        shift_counter(
+            field.related_model.objects.filter(
+                pk=getattr(connection, field.attname)),
+            counter_name, step)
+
+
+# Счётчики меняются сигналами, поэтому их учитывают и админка, и каскадное
+# удаление (удаление пользователя удаляет его подписки, избранное и список
+# покупок). Связи АПИ создаются и удаляются SQL-запросами без сигналов и
+# сдвигают счётчики сами, массовые загрузки их пересчитывают, а фикстуры
+# (raw) приносят готовые
+def count_created(sender, instance, created, raw=False, **kwargs):
+    if not created or raw:
+        return
+    shift_connection_counters(instance, 1)
+
+
+def count_deleted(sender, instance, **kwargs):
+    shift_connection_counters(instance, -1)
@@ -0,0 +1,193 @@
+import os
+from threading import Condition, Lock
+from time import monotonic
+
+from django.conf import settings
+
+# Счётчики пулов, отдаются вместе с метриками запросов
+POOL_COUNTERS = ('checkouts', 'waits', 'wait_seconds', 'timeouts',
+                 'connects', 'failed_checks', 'closes')
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Connections to one database shared by threads of process.
+
+    Number of open connections is bounded by max_size, thread waits for
+    released connection up to timeout. Connection which was idle longer
+    than check_interval is checked before checkout, connection older
+    than max_lifetime is closed instead of being reused.
+    """
+
+    def __init__(self, alias, database, connect, check, max_size, timeout,
+                 max_lifetime, check_interval):
+        self.alias = alias
+        self.database = database
+        self.connect = connect
+        self.check = check
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.check_interval = check_interval
+        self.condition = Condition()
+        # Свободные соединения со временем возврата, последнее берётся
+        # первым, лишние соединения дольше простаивают и закрываются
+        self.idle = []
+        self.created = {}
+        # Открытые и открываемые соединения
+        self.size = 0
+        self.closed = False
+        self.counters = dict.fromkeys(POOL_COUNTERS, 0)
+        self.pid = os.getpid()
+        self.inherited = []
+
+    def check_pid(self):
+        # После fork соединения родителя не закрываются: закрытие из
+        # дочернего процесса завершило бы сессии родителя
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.inherited.extend(self.created)
+            self.idle = []
+            self.created = {}
+            self.size = 0
+
+    def is_reusable(self, connection, released):
+        now = monotonic()
+        if now - self.created[connection] >= self.max_lifetime:
+            return False
+        if now - released < self.check_interval:
+            return True
+        try:
+            self.check(connection)
+        except Exception:
+            with self.condition:
+                self.counters['failed_checks'] += 1
+            return False
+        return True
+
+    def acquire(self):
+        with self.condition:
+            self.check_pid()
+            if self.closed:
+                raise PoolTimeout('Connection pool is closed')
+            waiting_since = None
+            while not self.idle and self.size >= self.max_size:
+                now = monotonic()
+                if waiting_since is None:
+                    waiting_since = now
+                    self.counters['waits'] += 1
+                remaining = waiting_since + self.timeout - now
+                if remaining <= 0:
+                    self.counters['timeouts'] += 1
+                    self.counters['wait_seconds'] += now - waiting_since
+                    raise PoolTimeout(
+                        f'No free connection to {self.database} in '
+                        f'{self.timeout} s, pool size is {self.max_size}')
+                self.condition.wait(remaining)
+            if waiting_since is not None:
+                self.counters['wait_seconds'] += monotonic() - waiting_since
+            self.counters['checkouts'] += 1
+            if self.idle:
+                connection, released = self.idle.pop()
+            else:
+                connection = None
+                self.size += 1
+        if connection is not None:
+            if self.is_reusable(connection, released):
+                return connection
+            # Место в пуле остаётся за новым соединением
+            self.close_connection(connection)
+        try:
+            connection = self.connect()
+        except BaseException:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.created[connection] = monotonic()
+            self.counters['connects'] += 1
+        return connection
+
+    def release(self, connection, reusable=True):
+        with self.condition:
+            self.check_pid()
+            if connection not in self.created:
+                return
+            if (reusable and not self.closed
+                    and monotonic() - self.created[connection]
+                    < self.max_lifetime):
+                self.idle.append((connection, monotonic()))
+                self.condition.notify()
+                return
+            self.size -= 1
+            self.condition.notify()
+        self.close_connection(connection)
+
+    def close_connection(self, connection):
+        with self.condition:
+            self.created.pop(connection, None)
+            self.counters['closes'] += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """Close idle connections, checked out ones are closed on release."""
+        with self.condition:
+            self.check_pid()
+            self.closed = True
+            idle, self.idle = self.idle, []
+            self.size -= len(idle)
+            self.condition.notify_all()
+        for connection, _ in idle:
+            self.close_connection(connection)
+
+    def get_stats(self):
+        with self.condition:
+            return {**self.counters,
+                    'size': self.size,
+                    'idle': len(self.idle),
+                    'in_use': self.size - len(self.idle),
+                    'max_size': self.max_size}
+
+
+pools = {}
+pools_lock = Lock()
+
+
+def get_pool(alias, conn_params, connect, check):
+    """Pool of process for alias and connection parameters.
+
+    Parameters are part of key because test runner switches database
+    name of alias.
+    """
+    key = (alias, repr(sorted(conn_params.items())))
+    with pools_lock:
+        if key not in pools:
+            pools[key] = ConnectionPool(
+                alias, conn_params.get('database'), connect, check,
+                settings.DB_POOL_SIZE, settings.DB_POOL_TIMEOUT,
+                settings.DB_POOL_MAX_LIFETIME, settings.DB_POOL_CHECK_INTERVAL)
+        return pools[key]
+
+
+def close_pools(database=None):
+    """Close pools of all or of given database and forget them."""
+    with pools_lock:
+        closed = [key for key, pool in pools.items()
+                  if database is None or pool.database == database]
+        closed = [pools.pop(key) for key in closed]
+    for pool in closed:
+        pool.close()
+
+
+def get_pools_stats():
+    with pools_lock:
+        current = list(pools.values())
+    return [(pool.alias, pool.database, pool.get_stats())
+            for pool in current]
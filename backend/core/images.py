@@ -0,0 +1,63 @@
+import io
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+PIL_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+SOURCE_KEY = 'source'
+
+
+def encode(image, format):
+    """Image in format without metadata (EXIF, ICC profile)."""
+    if format == 'jpeg' and image.mode != 'RGB':
+        with_alpha = image.convert('RGBA')
+        image = Image.new('RGB', with_alpha.size, 'white')
+        image.paste(with_alpha, mask=with_alpha.getchannel('A'))
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    buffer = io.BytesIO()
+    image.save(buffer, PIL_FORMATS[format],
+               quality=settings.IMAGE_VARIANT_QUALITY)
+    return buffer.getvalue()
+
+
+def create_variants(image_file, variant_names):
+    """Save size capped variants of image in all formats."""
+    variants = {}
+    with image_file.open('rb'), Image.open(image_file) as source:
+        source = ImageOps.exif_transpose(source)
+        for variant_name in variant_names:
+            image = source.copy()
+            image.thumbnail(settings.IMAGE_VARIANT_SIZES[variant_name])
+            variants[variant_name] = {
+                format: image_file.storage.save(
+                    image_file.field.generate_filename(
+                        image_file.instance, f'{variant_name}.{format}'),
+                    ContentFile(encode(image, format)))
+                for format in settings.IMAGE_VARIANT_FORMATS}
+    return variants
+
+
+def is_actual(variants, image_file):
+    return bool(image_file) and variants.get(SOURCE_KEY) == image_file.name
+
+
+def process_image(model, pk, field_name):
+    """Replace variants of record image if they were made for other file.
+
+    Replaced variant files may be shared with other records, they are
+    removed by collect_media_garbage when nothing references them.
+    """
+    variants_field_name, variant_names = model.IMAGE_VARIANTS[field_name]
+    instance = model._default_manager.filter(pk=pk).first()
+    if instance is None:
+        return
+    image_file = getattr(instance, field_name)
+    if not image_file or is_actual(
+            getattr(instance, variants_field_name), image_file):
+        return
+    setattr(instance, variants_field_name, {
+        SOURCE_KEY: image_file.name,
+        **create_variants(image_file, variant_names)})
+    instance.save(update_fields=(variants_field_name,))
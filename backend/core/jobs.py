@@ -0,0 +1,84 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+def register(name, max_attempts=None):
+    """Decorator which makes function runnable as job with given name.
+
+    Function gets job arguments as keyword arguments and returns JSON
+    serializable result.
+    """
+    def decorator(function):
+        registry[name] = (function, max_attempts or settings.JOB_MAX_ATTEMPTS)
+        return function
+    return decorator
+
+
+def enqueue(name, user_id=None, delay=0, **arguments):
+    """Queue job, it is taken by workers after commit of current transaction.
+
+    Returned job is polled by its pk, jobs of user are shown by
+    api/jobs/.
+    """
+    _, max_attempts = registry[name]
+    job = Job.objects.create(
+        name=name,
+        arguments=arguments,
+        user_id=user_id,
+        max_attempts=max_attempts,
+        run_after=timezone.now() + timedelta(seconds=delay))
+    if settings.JOBS_EAGER:
+        transaction.on_commit(lambda: run_eagerly(job.pk))
+    return job
+
+
+def execute(job):
+    """Run claimed job and save its result or schedule next attempt."""
+    try:
+        if job.name not in registry:
+            # Задачу могли переименовать или воркер ещё не обновлён:
+            # ошибка записывается, попытки повторяются как при сбое
+            raise LookupError(f'Unknown job {job.name}')
+        function, _ = registry[job.name]
+        result = function(**job.arguments)
+    except Exception:
+        logger.exception('Job %s failed', job)
+        if job.attempts < job.max_attempts:
+            changes = {
+                'status': Job.QUEUED,
+                'run_after': timezone.now() + timedelta(
+                    seconds=settings.JOB_RETRY_DELAY
+                    * 2 ** (job.attempts - 1))}
+        else:
+            changes = {'status': Job.FAILED, 'finished': timezone.now()}
+        changes['error'] = traceback.format_exc()
+    else:
+        changes = {'status': Job.DONE,
+                   'result': result,
+                   'finished': timezone.now()}
+    Job.objects.filter(pk=job.pk, status=Job.RUNNING).update(**changes)
+
+
+def run_eagerly(pk):
+    if Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, started=timezone.now(), attempts=1):
+        execute(Job.objects.get(pk=pk))
+
+
+def run_in_thread(job):
+    close_old_connections()
+    try:
+        execute(job)
+    finally:
+        connections.close_all()
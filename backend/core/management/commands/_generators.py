@@ -0,0 +1,372 @@
+import csv
+import io
+import json
+import random
+from contextlib import contextmanager, nullcontext
+from datetime import timedelta
+from itertools import accumulate, count
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Max
+from django.db.transaction import TransactionManagementError
+from django.utils import timezone
+from PIL import Image
+
+from ...models import (Ingredient, Recipe, RecipeIngredient, RecipeTag,
+                       Subscription, Tag, User, UserRecipeFavorite,
+                       UserRecipeShoppingList)
+from ._loaders import COPY_NULL
+
+TAGS = (('Завтрак', 'breakfast'), ('Обед', 'lunch'), ('Ужин', 'dinner'),
+        ('Десерт', 'dessert'), ('Выпечка', 'bakery'))
+PASSWORD = 'generated-password'
+GENERATED_MODELS = (User, Recipe, RecipeIngredient, RecipeTag,
+                    UserRecipeFavorite, UserRecipeShoppingList, Subscription)
+
+
+class ZipfSampler:
+    """Random items where item of rank k has weight 1 / k ** exponent.
+
+    Ranks are given by order of items, shuffle them to hide it.
+    """
+
+    def __init__(self, items, exponent, rng):
+        self.items = items
+        self.rng = rng
+        self.cum_weights = list(accumulate(
+            1 / rank ** exponent for rank in range(1, len(items) + 1)))
+
+    def choice(self):
+        return self.rng.choices(self.items, cum_weights=self.cum_weights)[0]
+
+    def sample(self, size):
+        """Size distinct items, popular ones are more likely."""
+        size = min(size, len(self.items))
+        chosen = {}
+        for _ in range(8):
+            if len(chosen) >= size:
+                break
+            chosen.update(dict.fromkeys(self.rng.choices(
+                self.items, cum_weights=self.cum_weights,
+                k=size - len(chosen))))
+        # Редкие элементы почти не выпадают, остаток берётся равномерно
+        # по случайным индексам, без перебора всех элементов
+        randrange = self.rng.randrange
+        while len(chosen) < size:
+            chosen.setdefault(self.items[randrange(len(self.items))])
+        return list(chosen)[:size]
+
+
+def get_skewed_count(rng, average, maximum, alpha=1.5):
+    """Pareto distributed count with given average, most are below it."""
+    if not average:
+        return 0
+    value = average * (alpha - 1) / alpha * rng.paretovariate(alpha)
+    return min(int(value), maximum)
+
+
+class BulkWriter:
+    """Writer of rows with values of given columns with bulk_create."""
+
+    def __init__(self, model, columns, batch_size, using=DEFAULT_DB_ALIAS):
+        self.model = model
+        self.columns = columns
+        self.batch_size = batch_size
+        self.using = using
+        self.batch = []
+        self.written_count = 0
+
+    def write(self, row):
+        self.batch.append(row)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def insert(self, rows):
+        self.model.objects.using(self.using).bulk_create(
+            self.model(**dict(zip(self.columns, row))) for row in rows)
+
+    def flush(self):
+        if self.batch:
+            self.insert(self.batch)
+            self.written_count += len(self.batch)
+            self.batch = []
+
+
+class CopyWriter(BulkWriter):
+    """Writer which sends batches straight to table with COPY.
+
+    Rows contain numbers, strings and datetimes, other fields get their
+    defaults. Works with Postgres only and expects new primary keys,
+    conflicts are not skipped.
+    """
+
+    def __init__(self, model, columns, batch_size, using=DEFAULT_DB_ALIAS):
+        super().__init__(model, columns, batch_size, using)
+        fields = {field.attname: field
+                  for field in model._meta.concrete_fields}
+        rest = [field for attname, field in fields.items()
+                if attname not in columns]
+        self.table_columns = [fields[attname].column for attname in columns]
+        self.table_columns.extend(field.column for field in rest)
+        self.defaults = tuple(
+            self.get_copy_value(field.get_default()) for field in rest)
+
+    def get_copy_value(self, value):
+        if value is None:
+            return COPY_NULL
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, ensure_ascii=False)
+        return value
+
+    def insert(self, rows):
+        buffer = io.StringIO()
+        defaults = self.defaults
+        csv.writer(buffer).writerows(row + defaults for row in rows)
+        buffer.seek(0)
+        quote_name = connections[self.using].ops.quote_name
+        columns = ', '.join(map(quote_name, self.table_columns))
+        with connections[self.using].cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {quote_name(self.model._meta.db_table)} ({columns}) '
+                f"FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')",
+                buffer)
+
+
+WRITERS = {
+    'bulk': BulkWriter,
+    'copy': CopyWriter,
+}
+
+
+@contextmanager
+def foreign_keys_dropped(models, using=DEFAULT_DB_ALIAS):
+    """Drop foreign keys of model tables and add them back after block.
+
+    Postgres checks added key with one query instead of deferred checks
+    of every copied row which take longer than copying. Tables stay
+    locked for writes and reads until commit. Works with Postgres only
+    inside transaction, on errors keys are restored by its rollback.
+    """
+    if not connections[using].in_atomic_block:
+        raise TransactionManagementError(
+            'Foreign keys are dropped only inside transaction')
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            'SELECT conrelid::regclass, conname, pg_get_constraintdef(oid) '
+            'FROM pg_constraint '
+            "WHERE contype = 'f' AND conrelid = ANY(%s::regclass[])",
+            ([model._meta.db_table for model in models],))
+        foreign_keys = cursor.fetchall()
+        for table, name, _ in foreign_keys:
+            cursor.execute(f'ALTER TABLE {table} DROP CONSTRAINT "{name}"')
+    yield
+    with connections[using].cursor() as cursor:
+        for table, name, definition in foreign_keys:
+            cursor.execute(
+                f'ALTER TABLE {table} ADD CONSTRAINT "{name}" {definition}')
+
+
+def load_ingredients(path=None):
+    """Ingredients from data/ingredients.json if there are none yet."""
+    if not Ingredient.objects.exists():
+        path = path or settings.BASE_DIR.parent / 'data' / 'ingredients.json'
+        with open(path, encoding='utf-8') as file:
+            Ingredient.objects.bulk_create(
+                (Ingredient(**values) for values in json.load(file)),
+                batch_size=settings.LOAD_BATCH_SIZE)
+    return list(Ingredient.objects.order_by('id').values_list(
+        'id', 'name'))
+
+
+def load_tags():
+    Tag.objects.bulk_create(
+        (Tag(name=name, slug=slug) for name, slug in TAGS),
+        ignore_conflicts=True)
+    return list(Tag.objects.order_by('id').values_list('id', flat=True))
+
+
+def save_images(rng, size):
+    """Names of pool of images shared by generated recipes."""
+    field = Recipe._meta.get_field('image')
+    names = []
+    for _ in range(size):
+        buffer = io.BytesIO()
+        Image.new('RGB', (rng.randint(400, 1200), rng.randint(300, 900)),
+                  tuple(rng.randrange(256) for _ in range(3))).save(
+            buffer, 'PNG')
+        names.append(default_storage.save(
+            field.generate_filename(None, 'generated.png'),
+            ContentFile(buffer.getvalue())))
+    return names
+
+
+class DataGenerator:
+    """Deterministic skewed data for performance investigations.
+
+    Authors of recipes, popular recipes of favorites and carts, authors
+    of subscriptions and ingredients of recipes are chosen by Zipf-like
+    distributions, numbers of favorites, subscriptions and cart recipes
+    of users are Pareto distributed. Records get explicit ids after
+    existing ones, so relations are written without reading ids back,
+    and sequences are reset at the end. Recipes reuse small pool of
+    stored images instead of decoding uploaded ones. Foreign keys may be
+    dropped while writing, which locks generated tables, so it is left
+    for databases without other clients.
+    """
+
+    def __init__(self, method='copy', seed=1, batch_size=10000,
+                 exponent=1.0, images=10, drop_foreign_keys=False,
+                 using=DEFAULT_DB_ALIAS):
+        self.writer_class = WRITERS[method]
+        self.drop_foreign_keys = drop_foreign_keys
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.exponent = exponent
+        self.images = images
+        self.using = using
+        self.counts = {}
+
+    def get_first_id(self, model):
+        return (model.objects.using(self.using).aggregate(
+            Max('id'))['id__max'] or 0) + 1
+
+    def get_ids(self, model, size):
+        first_id = self.get_first_id(model)
+        return range(first_id, first_id + size)
+
+    def get_writer(self, model, columns):
+        return self.writer_class(
+            model, columns, self.batch_size, self.using)
+
+    def write(self, model, columns, rows):
+        writer = self.get_writer(model, columns)
+        for row in rows:
+            writer.write(row)
+        writer.flush()
+        self.counts[model] = writer.written_count
+
+    def get_sampler(self, ids):
+        popular_ids = list(ids)
+        self.rng.shuffle(popular_ids)
+        return ZipfSampler(popular_ids, self.exponent, self.rng)
+
+    def randint(self, low, high):
+        # Быстрее random.randint, который вызывается для каждой строки
+        return low + int(self.rng.random() * (high - low + 1))
+
+    def generate_users(self, user_ids):
+        password = make_password(PASSWORD)
+        for user_id in user_ids:
+            yield (user_id, f'user{user_id}', f'user{user_id}@example.com',
+                   f'Имя{user_id}', f'Фамилия{user_id}', password)
+
+    def generate_recipes(self, recipe_ids, authors, words):
+        images = save_images(self.rng, self.images)
+        # Рецепты публикуются раз в минуту, последний - сейчас
+        published = timezone.now() - timedelta(minutes=len(recipe_ids))
+        choices = self.rng.choices
+        for number, recipe_id in enumerate(recipe_ids):
+            yield (recipe_id,
+                   authors.choice(),
+                   ' '.join(choices(words, k=3))[:settings.MAX_RECIPE_NAME],
+                   ' '.join(choices(words, k=15)),
+                   self.randint(settings.MIN_COOKING_TIME, 180),
+                   choices(images)[0],
+                   published + timedelta(minutes=number))
+
+    def write_recipe_links(self, recipe_ids, ingredients, tag_ids,
+                           ingredients_range):
+        """Ingredients and tags of recipes."""
+        ingredient_writer = self.get_writer(
+            RecipeIngredient, ('id', 'recipe_id', 'ingredient_id', 'amount'))
+        tag_writer = self.get_writer(RecipeTag, ('id', 'recipe_id', 'tag_id'))
+        ingredient_link_ids = count(self.get_first_id(RecipeIngredient))
+        tag_link_ids = count(self.get_first_id(RecipeTag))
+        for recipe_id in recipe_ids:
+            for ingredient_id in ingredients.sample(
+                    self.randint(*ingredients_range)):
+                ingredient_writer.write((
+                    next(ingredient_link_ids), recipe_id, ingredient_id,
+                    self.randint(1, 500)))
+            for tag_id in self.rng.sample(
+                    tag_ids, self.randint(1, min(3, len(tag_ids)))):
+                tag_writer.write((next(tag_link_ids), recipe_id, tag_id))
+        for model, writer in ((RecipeIngredient, ingredient_writer),
+                              (RecipeTag, tag_writer)):
+            writer.flush()
+            self.counts[model] = writer.written_count
+
+    def generate_pairs(self, model, user_ids, sampler, average):
+        ids = count(self.get_first_id(model))
+        # Пользователь не подписывается сам на себя
+        extra = int(model is Subscription)
+        maximum = min(len(sampler.items) - extra,
+                      average * settings.GENERATE_MAX_COUNT_RATIO)
+        for user_id in user_ids:
+            size = get_skewed_count(self.rng, average, maximum)
+            right_ids = [right_id for right_id
+                         in sampler.sample(size + extra)
+                         if not extra or right_id != user_id][:size]
+            for right_id in right_ids:
+                yield next(ids), user_id, right_id
+
+    def generate(self, users, recipes, favorites=20, subscriptions=5,
+                 carts=5, ingredients_range=(5, 30)):
+        """Write records, returns numbers of written rows by model."""
+        with (foreign_keys_dropped(GENERATED_MODELS, self.using)
+              if self.drop_foreign_keys else nullcontext()):
+            self.write_all(users, recipes, favorites, subscriptions, carts,
+                           ingredients_range)
+        self.finish()
+        return self.counts
+
+    def write_all(self, users, recipes, favorites, subscriptions, carts,
+                  ingredients_range):
+        ingredients = load_ingredients()
+        tag_ids = load_tags()
+        words = [name for _, name in ingredients]
+        user_ids = self.get_ids(User, users)
+        self.write(User, ('id', 'username', 'email', 'first_name',
+                          'last_name', 'password'),
+                   self.generate_users(user_ids))
+        authors = self.get_sampler(user_ids)
+        recipe_ids = self.get_ids(Recipe, recipes)
+        self.write(Recipe, ('id', 'author_id', 'name', 'text', 'cooking_time',
+                            'image', 'pub_date'),
+                   self.generate_recipes(recipe_ids, authors, words))
+        self.write_recipe_links(
+            recipe_ids,
+            self.get_sampler([ingredient_id for ingredient_id, _
+                              in ingredients]),
+            tag_ids,
+            ingredients_range)
+        popular_recipes = self.get_sampler(recipe_ids)
+        for model, columns, sampler, average in (
+                (UserRecipeFavorite, ('id', 'user_id', 'recipe_id'),
+                 popular_recipes, favorites),
+                (UserRecipeShoppingList, ('id', 'user_id', 'recipe_id'),
+                 popular_recipes, carts),
+                (Subscription, ('id', 'subscriber_id', 'subscription_id'),
+                 authors, subscriptions)):
+            self.write(model, columns, self.generate_pairs(
+                model, user_ids, sampler, average))
+
+    def finish(self):
+        """Reset sequences after explicit ids and refresh statistics."""
+        connection = connections[self.using]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                    no_style(), GENERATED_MODELS):
+                cursor.execute(sql)
+            if connection.vendor == 'postgresql':
+                # Без статистики планировщик считает таблицы пустыми и
+                # пересчёт счётчиков выбирает вложенные циклы
+                quote_name = connection.ops.quote_name
+                for model in GENERATED_MODELS:
+                    cursor.execute(
+                        f'ANALYZE {quote_name(model._meta.db_table)}')
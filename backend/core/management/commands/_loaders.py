@@ -0,0 +1,159 @@
+import csv
+import io
+
+from django.core.exceptions import ValidationError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from ...models import (MediaBlob, Recipe, RecipeIngredient, Subscription, User,
+                       UserRecipeFavorite, UserRecipeShoppingList,
+                       UserShoppingListIngredient)
+from ._resolvers import ForeignKeyResolver
+
+COPY_NULL = r'\N'
+
+
+def get_error_detail(error):
+    if isinstance(error, ValidationError):
+        return (error.message_dict if hasattr(error, 'error_dict')
+                else error.messages)
+    return str(error)
+
+
+def refresh_denormalized(models):
+    """Update data derived from records of loaded models.
+
+    Bulk inserts bypass save() and api actions which keep it actual.
+    """
+    if Recipe in models:
+        Recipe.objects.filter(
+            search_vector__isnull=True).update_search_vector()
+    if models & {Recipe, Subscription}:
+        User.objects.recount_counters()
+    if models & {UserRecipeFavorite, UserRecipeShoppingList}:
+        Recipe.objects.recount_counters()
+    if models & {RecipeIngredient, UserRecipeShoppingList}:
+        UserShoppingListIngredient.objects.rebuild()
+    if models & {Recipe, User}:
+        MediaBlob.objects.recount()
+
+
+class BulkLoader:
+    """Loader of rows validated by model fields with batched inserts.
+
+    Rows are streamed, only a batch of them is kept in memory. Foreign
+    keys are resolved by ForeignKeyResolver, rows conflicting with
+    existing records are skipped by database, invalid ones are passed
+    to reject(row, error) callback.
+    """
+
+    def __init__(self, model, batch_size, reject, cache_size,
+                 using=DEFAULT_DB_ALIAS):
+        self.model = model
+        self.batch_size = batch_size
+        self.reject = reject
+        self.using = using
+        self.resolver = ForeignKeyResolver(model, cache_size)
+        self.read_count = 0
+        self.rejected_count = 0
+
+    def build(self, values):
+        if not isinstance(values, dict):
+            raise ValueError('Object is expected')
+        instance = self.model(**values)
+        # Существование связанных записей уже проверено при разрешении
+        instance.full_clean(
+            exclude=self.resolver.field_names, validate_unique=False)
+        return instance
+
+    def insert(self, instances):
+        self.model.objects.using(self.using).bulk_create(
+            instances, ignore_conflicts=True)
+
+    def flush(self, rows, progress):
+        instances = []
+        for row, values, error in self.resolver.resolve(rows):
+            if error is None:
+                try:
+                    instances.append(self.build(values))
+                except (TypeError, ValueError, ValidationError) as build_error:
+                    error = build_error
+            if error is not None:
+                self.rejected_count += 1
+                self.reject(row, error)
+        if instances:
+            self.insert(instances)
+        if progress:
+            progress(self)
+
+    def load(self, rows, progress=None):
+        """Load pairs of row and its parse error from reader."""
+        batch = []
+        for row, error in rows:
+            self.read_count += 1
+            if error is not None:
+                self.rejected_count += 1
+                self.reject(row, error)
+                continue
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                self.flush(batch, progress)
+                batch = []
+        self.flush(batch, progress)
+
+
+class CopyLoader(BulkLoader):
+    """Loader which copies batches to temporary staging table.
+
+    Rows are moved from staging table with INSERT ... ON CONFLICT DO
+    NOTHING, works with Postgres only.
+    """
+
+    staging_table = None
+
+    def get_staging_table(self, cursor):
+        if self.staging_table is None:
+            quote_name = connections[self.using].ops.quote_name
+            self.staging_table = quote_name(
+                f'{self.model._meta.db_table}_staging')
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE {self.staging_table} '
+                'ON COMMIT DROP AS SELECT * FROM '
+                f'{quote_name(self.model._meta.db_table)} WITH NO DATA')
+        return self.staging_table
+
+    def get_copy_value(self, field, instance, connection):
+        value = field.get_db_prep_save(
+            field.pre_save(instance, True), connection)
+        return COPY_NULL if value is None else value
+
+    def insert(self, instances):
+        connection = connections[self.using]
+        quote_name = connection.ops.quote_name
+        with_pk = all(instance.pk is not None for instance in instances)
+        fields = [field for field in self.model._meta.concrete_fields
+                  if with_pk or not field.primary_key]
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for instance in instances:
+            writer.writerow(
+                self.get_copy_value(field, instance, connection)
+                for field in fields)
+        buffer.seek(0)
+        columns = ', '.join(quote_name(field.column) for field in fields)
+        with connection.cursor() as cursor:
+            staging_table = self.get_staging_table(cursor)
+            cursor.copy_expert(
+                f'COPY {staging_table} ({columns}) FROM STDIN '
+                f"WITH (FORMAT csv, NULL '{COPY_NULL}')",
+                buffer)
+            cursor.execute(
+                f'INSERT INTO {quote_name(self.model._meta.db_table)} '
+                f'({columns}) SELECT {columns} FROM {staging_table} '
+                'ON CONFLICT DO NOTHING')
+            cursor.execute(f'TRUNCATE {staging_table}')
+
+
+LOADERS = {
+    'bulk': BulkLoader,
+    'copy': CopyLoader,
+}
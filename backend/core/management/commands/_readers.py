@@ -0,0 +1,49 @@
+import csv
+import json
+import os
+
+from django.core.management.base import CommandError
+
+
+def read_csv(file):
+    for row in csv.DictReader(file):
+        yield row, None
+
+
+def read_json(file):
+    try:
+        rows = json.load(file)
+    except ValueError as error:
+        raise CommandError(f'{file.name}: {error}')
+    if not isinstance(rows, list):
+        raise CommandError(f'{file.name}: list of objects is expected')
+    for row in rows:
+        yield row, None
+
+
+def read_ndjson(file):
+    for line in file:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line), None
+        except ValueError as error:
+            yield line, error
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+    '.ndjson': read_ndjson,
+    '.jsonl': read_ndjson,
+}
+
+
+def read_rows(file):
+    """Pairs of row and its parse error by extension of the file."""
+    extension = os.path.splitext(file.name)[1].lower()
+    if extension not in READERS:
+        raise CommandError(
+            f'{file.name}: unknown format, expected one of '
+            f'{", ".join(READERS)}')
+    return READERS[extension](file)
@@ -0,0 +1,154 @@
+from collections import OrderedDict
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+from ...models import Ingredient, Recipe, Tag, User
+
+# Поля, по которым строки файлов ссылаются на связанные записи вместо id
+NATURAL_KEYS = {
+    Ingredient: ('name',),
+    Tag: ('slug',),
+    User: ('email',),
+    Recipe: ('author__email', 'name'),
+}
+PK_LOOKUPS = ('pk',)
+AMBIGUOUS = 'ambiguous'
+
+
+class LookupCache:
+    """Bounded mapping of keys to ids, least recently used are evicted."""
+
+    def __init__(self, size):
+        self.size = size
+        self.items = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def __getitem__(self, key):
+        self.items.move_to_end(key)
+        return self.items[key]
+
+    def __setitem__(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        while len(self.items) > self.size:
+            self.items.popitem(last=False)
+
+
+class ForeignKeyResolver:
+    """Replaces references of rows to related records with their ids.
+
+    Related record is referenced by <field>_id, by <field> with natural
+    key value (list for composite keys) or by <field>__<lookup> columns
+    of natural key. Keys of a batch are fetched with one query per
+    related model and kept in bounded caches between batches.
+    """
+
+    def __init__(self, model, cache_size):
+        self.fields = [field for field in model._meta.concrete_fields
+                       if field.many_to_one or field.one_to_one]
+        self.field_names = [field.name for field in self.fields]
+        self.cache_size = cache_size
+        self.caches = {}
+
+    def get_reference(self, field, row):
+        """Lookups and key of referenced record, popped from row."""
+        related_model = field.related_model
+        natural_key = NATURAL_KEYS.get(related_model)
+        if field.attname in row or (
+                field.name in row and natural_key is None):
+            value = row.pop(field.attname, None)
+            if value is None:
+                value = row.pop(field.name)
+            if value in (None, ''):
+                return self.get_empty_reference(field)
+            return PK_LOOKUPS, (
+                str(related_model._meta.pk.to_python(value)),)
+        if field.name in row:
+            value = row.pop(field.name)
+            if value in (None, ''):
+                return self.get_empty_reference(field)
+            key = (tuple(value) if isinstance(value, (list, tuple))
+                   else (value,))
+            if len(key) != len(natural_key):
+                raise ValueError(
+                    f'{field.name}: natural key '
+                    f'({", ".join(natural_key)}) is expected')
+            return natural_key, tuple(map(str, key))
+        columns = [f'{field.name}__{lookup}'
+                   for lookup in natural_key or ()]
+        if any(column in row for column in columns):
+            return natural_key, tuple(
+                str(row.pop(column, '')) for column in columns)
+        return self.get_empty_reference(field)
+
+    def get_empty_reference(self, field):
+        if not field.null:
+            raise ValueError(f'{field.name}: reference is required')
+        return None
+
+    def get_cache(self, related_model, lookups):
+        return self.caches.setdefault(
+            (related_model, lookups), LookupCache(self.cache_size))
+
+    def fetch(self, related_model, lookups, keys):
+        condition = (
+            Q(**{f'{lookups[0]}__in': [key[0] for key in keys]})
+            if len(lookups) == 1
+            else reduce(or_, (Q(**dict(zip(lookups, key))) for key in keys)))
+        found = dict.fromkeys(keys)
+        for *key, pk in related_model._default_manager.filter(
+                condition).values_list(*lookups, 'pk'):
+            key = tuple(map(str, key))
+            found[key] = AMBIGUOUS if found.get(key) is not None else pk
+        return found
+
+    def resolve(self, rows):
+        """Triples of row, its values with ids of related records, error."""
+        prepared = []
+        wanted = {}
+        resolved = {}
+        for row in rows:
+            if not isinstance(row, dict):
+                prepared.append((row, row, {}, None))
+                continue
+            values = dict(row)
+            row_references = {}
+            try:
+                for field in self.fields:
+                    reference = self.get_reference(field, values)
+                    if reference is None:
+                        continue
+                    row_references[field] = reference
+                    lookups, key = reference
+                    cache = self.get_cache(field.related_model, lookups)
+                    if key in cache:
+                        resolved[field.related_model, lookups, key] = (
+                            cache[key])
+                    else:
+                        wanted.setdefault(
+                            (field.related_model, lookups), set()).add(key)
+            except (TypeError, ValueError, ValidationError) as error:
+                prepared.append((row, values, {}, error))
+                continue
+            prepared.append((row, values, row_references, None))
+        for (related_model, lookups), keys in wanted.items():
+            cache = self.get_cache(related_model, lookups)
+            for key, pk in self.fetch(related_model, lookups, keys).items():
+                cache[key] = pk
+                resolved[related_model, lookups, key] = pk
+        for row, values, row_references, error in prepared:
+            for field, (lookups, key) in row_references.items():
+                pk = resolved[field.related_model, lookups, key]
+                if pk is None or pk == AMBIGUOUS:
+                    error = ValueError(
+                        f'{field.name}: {"several" if pk else "no"} '
+                        f'{field.related_model._meta.verbose_name_plural} '
+                        f'match {dict(zip(lookups, key))}')
+                    break
+                values[field.attname] = pk
+            yield row, values, error
@@ -0,0 +1,101 @@
+import posixpath
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ...models import MediaBlob, Recipe, User
+
+
+def walk(storage, directory):
+    """Names of all files under storage directory."""
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for file_name in files:
+        yield posixpath.join(directory, file_name)
+    for directory_name in directories:
+        yield from walk(storage, posixpath.join(directory, directory_name))
+
+
+class Command(BaseCommand):
+    help = ('Delete stored files which are not referenced by recipes and '
+            'users and were not changed during grace period')
+
+    def is_expired(self, name):
+        try:
+            return (default_storage.get_modified_time(name)
+                    < self.expired_before)
+        except FileNotFoundError:
+            return True
+
+    def delete(self, name):
+        if not self.dry_run:
+            default_storage.delete(name)
+        self.deleted_count += 1
+        if self.verbosity > 1:
+            self.stdout.write(name)
+
+    def collect_unreferenced(self):
+        for name in MediaBlob.objects.filter(
+                references_count=0).values_list('name', flat=True):
+            if not self.is_expired(name):
+                continue
+            if self.dry_run:
+                self.delete(name)
+            # Запись удаляется до файла, ссылка могла появиться после выборки
+            elif MediaBlob.objects.filter(
+                    name=name, references_count=0).delete()[0]:
+                self.delete(name)
+
+    def collect_orphans(self):
+        """Delete files which have no reference counts at all."""
+        referenced = set(MediaBlob.objects.filter(
+            references_count__gt=0).values_list('name', flat=True))
+        directories = {
+            model._meta.get_field(field_name).upload_to.rstrip('/')
+            for model in (Recipe, User)
+            for field_name in model.IMAGE_VARIANTS}
+        for directory in directories:
+            for name in walk(default_storage, directory):
+                if name not in referenced and self.is_expired(name):
+                    self.delete(name)
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        self.dry_run = options['dry_run']
+        self.expired_before = timezone.now() - timedelta(
+            seconds=options['grace_period'])
+        self.deleted_count = 0
+        if options['recount'] or options['orphans']:
+            count = MediaBlob.objects.recount()
+            self.stdout.write(f'{count} referenced files are counted')
+        self.collect_unreferenced()
+        if options['orphans']:
+            self.collect_orphans()
+        self.stdout.write(
+            f'{self.deleted_count} files '
+            f'{"would be" if self.dry_run else "are"} deleted')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recount',
+            action='store_true',
+            help='Recount references of records before collecting')
+        parser.add_argument(
+            '--orphans',
+            action='store_true',
+            help='Also delete files in upload directories which are '
+                 'not counted (stored before counting or by bulk '
+                 'updates), implies --recount')
+        parser.add_argument(
+            '--grace-period',
+            type=int,
+            default=settings.MEDIA_GC_GRACE_PERIOD,
+            help='Seconds since last change of files which are kept')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report files which would be deleted')
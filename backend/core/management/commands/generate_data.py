@@ -0,0 +1,116 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from ...signals import bulk_loaded
+from ._generators import GENERATED_MODELS, WRITERS, DataGenerator
+from ._loaders import refresh_denormalized
+
+
+class Command(BaseCommand):
+    help = ('Generate deterministic skewed users, recipes, favorites, '
+            'subscriptions and shopping carts for performance '
+            'investigations. Rows are written with COPY (PostgreSQL) or '
+            'bulk_create in one transaction, generated users have '
+            'password "generated-password"')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            if options['method'] == 'copy':
+                raise CommandError('COPY method works with PostgreSQL only')
+            if options['drop_foreign_keys']:
+                raise CommandError(
+                    'Foreign keys are dropped with PostgreSQL only')
+        low, high = options['ingredients']
+        if not 0 < low <= high:
+            raise CommandError('Ingredients range is expected as MIN MAX')
+        generator = DataGenerator(
+            options['method'], options['seed'], options['batch_size'],
+            options['exponent'], options['images'],
+            options['drop_foreign_keys'])
+        started = time.perf_counter()
+        with transaction.atomic():
+            counts = generator.generate(
+                options['users'], options['recipes'], options['favorites'],
+                options['subscriptions'], options['carts'], (low, high))
+            for model, written_count in counts.items():
+                self.stdout.write(f'{model.__name__}: {written_count} rows')
+            self.stdout.write(
+                f'Written in {time.perf_counter() - started:.1f} s')
+            refresh_denormalized(set(GENERATED_MODELS))
+            for model in GENERATED_MODELS:
+                transaction.on_commit(
+                    lambda model=model: bulk_loaded.send(sender=model))
+        self.stdout.write(
+            f'Generated in {time.perf_counter() - started:.1f} s')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-u',
+            '--users',
+            type=int,
+            default=10000,
+            help='Number of users')
+        parser.add_argument(
+            '-r',
+            '--recipes',
+            type=int,
+            default=100000,
+            help='Number of recipes')
+        parser.add_argument(
+            '--favorites',
+            type=int,
+            default=20,
+            help='Average number of favorite recipes of user')
+        parser.add_argument(
+            '--subscriptions',
+            type=int,
+            default=5,
+            help='Average number of subscriptions of user')
+        parser.add_argument(
+            '--carts',
+            type=int,
+            default=5,
+            help='Average number of recipes in shopping cart of user')
+        parser.add_argument(
+            '--ingredients',
+            type=int,
+            nargs=2,
+            default=(5, 30),
+            metavar=('MIN', 'MAX'),
+            help='Range of number of ingredients of recipe')
+        parser.add_argument(
+            '--exponent',
+            type=float,
+            default=1.0,
+            help='Exponent of Zipf-like distributions, bigger is more '
+                 'skewed')
+        parser.add_argument(
+            '--images',
+            type=int,
+            default=10,
+            help='Size of pool of images shared by recipes')
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=1,
+            help='Seed of random generator, equal seeds give equal data '
+                 'in empty database')
+        parser.add_argument(
+            '--method',
+            choices=WRITERS.keys(),
+            default='copy',
+            help='COPY to tables (PostgreSQL) or bulk_create')
+        parser.add_argument(
+            '--drop-foreign-keys',
+            action='store_true',
+            help='Drop foreign keys of generated tables while writing and '
+                 'check them once at the end, which is about twice faster. '
+                 'Tables are locked until commit, API requests to them '
+                 'wait, so use it for databases without other clients')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10000,
+            help='Number of rows written at once')
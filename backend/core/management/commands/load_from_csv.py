@@ -1,27 +1,126 @@
-from django.core.management.base import BaseCommand
+import json
+from graphlib import CycleError, TopologicalSorter
 
-from ._csv_parsers import csv_parse
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from ...signals import bulk_loaded
 from ._introspects import get_name_model_dict
+from ._loaders import LOADERS, get_error_detail, refresh_denormalized
+from ._readers import read_rows
 
 
 class Command(BaseCommand):
-    help = 'Load data to database from CSV'
+    help = ('Load data to database from CSV, JSON or newline delimited '
+            'JSON files in one transaction. Files are given as path with '
+            '--model or as Model=path, models are loaded in order of '
+            'their foreign keys')
 
-    def handle(self, *args, **options):
-        model = get_name_model_dict()[options['model'][0]]
-        files = options['files']
+    rejects_file = None
+
+    def reject(self, row, error):
+        if self.rejects_file is None:
+            self.rejects_file = open(
+                self.rejects_path, 'w', encoding='utf-8')
+        self.rejects_file.write(json.dumps(
+            {'file': self.file_name,
+             'row': row,
+             'error': get_error_detail(error)},
+            ensure_ascii=False, default=str) + '\n')
+
+    def report_progress(self, loader):
+        if self.verbosity > 1:
+            self.stdout.write(
+                f'{self.file_name}: {loader.read_count} rows read, '
+                f'{loader.rejected_count} rejected')
+
+    def get_files_by_model(self, files, default_model_name):
+        models = get_name_model_dict()
+        files_by_model = {}
         for file in files:
-            csv_parse(self, file, model)
+            model_name, separator, file_name = file.partition('=')
+            if not separator:
+                model_name, file_name = default_model_name, file
+            if model_name not in models:
+                raise CommandError(
+                    f'{file}: model is expected as --model or Model=path')
+            files_by_model.setdefault(
+                models[model_name], []).append(file_name)
+        return files_by_model
+
+    def get_load_order(self, models):
+        try:
+            return list(TopologicalSorter({
+                model: {field.related_model
+                        for field in model._meta.concrete_fields
+                        if field.is_relation
+                        and field.related_model in models
+                        and field.related_model is not model}
+                for model in models}).static_order())
+        except CycleError as error:
+            raise CommandError(f'Models depend on each other: {error}')
+
+    def load_model(self, model, file_names, options):
+        loader = LOADERS[options['method']](
+            model,
+            options['batch_size'],
+            self.reject,
+            options['cache_size'])
+        count_before = model.objects.count()
+        for file_name in file_names:
+            self.file_name = file_name
+            with open(file_name, encoding='utf-8') as file:
+                loader.load(read_rows(file), self.report_progress)
+        created_count = model.objects.count() - count_before
+        self.stdout.write(
+            f'{model.__name__}: {loader.read_count} rows read, '
+            f'{created_count} created, '
+            f'{loader.read_count - loader.rejected_count - created_count} '
+            f'already existed, {loader.rejected_count} rejected')
+        return loader.rejected_count
+
+    def handle(self, *args, **options):
+        if options['method'] == 'copy' and connection.vendor != 'postgresql':
+            raise CommandError('COPY method works with PostgreSQL only')
+        files_by_model = self.get_files_by_model(
+            options['files'], options['model'] and options['model'][0])
+        self.verbosity = options['verbosity']
+        self.rejects_path = options['rejects']
+        rejected_count = 0
+        try:
+            with transaction.atomic():
+                for model in self.get_load_order(files_by_model.keys()):
+                    rejected_count += self.load_model(
+                        model, files_by_model[model], options)
+                refresh_denormalized(files_by_model.keys())
+                if options['dry_run']:
+                    transaction.set_rollback(True)
+                else:
+                    for model in files_by_model:
+                        transaction.on_commit(
+                            lambda model=model: bulk_loaded.send(
+                                sender=model))
+        finally:
+            if self.rejects_file is not None:
+                self.rejects_file.close()
+        if options['dry_run']:
+            self.stdout.write('Dry run, nothing is saved')
+        if rejected_count:
+            self.stdout.write(
+                self.style.WARNING(f'Rejected rows are written to '
+                                   f'{self.rejects_path}'))
 
     def add_arguments(self, parser):
         parser.add_argument(
             '-f',
             '--files',
-            action='append',
-            type=open,
+            action='extend',
             nargs='+',
             required=True,
-            help='CSV files to load'
+            help='CSV (.csv), JSON (.json) or newline delimited JSON '
+                 '(.ndjson, .jsonl) files to load, JSON arrays are read '
+                 'at once, other formats are streamed'
         )
         parser.add_argument(
             '-m',
@@ -29,5 +128,31 @@ class Command(BaseCommand):
             action='store',
             choices=get_name_model_dict().keys(),
             nargs=1,
-            required=True,
-            help='Model into which the values are loaded')
+            help='Model into which values of files without Model= are '
+                 'loaded')
+        parser.add_argument(
+            '--method',
+            choices=LOADERS.keys(),
+            default='bulk',
+            help='bulk_create batches or COPY through staging table '
+                 '(PostgreSQL only)')
+        parser.add_argument(
+            '-b',
+            '--batch-size',
+            type=int,
+            default=settings.LOAD_BATCH_SIZE,
+            help='Number of rows inserted at once')
+        parser.add_argument(
+            '--cache-size',
+            type=int,
+            default=settings.LOAD_LOOKUP_CACHE_SIZE,
+            help='Number of resolved foreign keys kept per related model')
+        parser.add_argument(
+            '-r',
+            '--rejects',
+            default='rejects.ndjson',
+            help='File for rejected rows with errors')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Validate and insert rows, then roll back')
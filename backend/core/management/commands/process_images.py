@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from ...images import SOURCE_KEY, process_image
+from ...models import Recipe, User
+
+
+class Command(BaseCommand):
+    help = 'Create missing or outdated variants of recipe images and avatars'
+
+    def handle(self, *args, **options):
+        for model in (Recipe, User):
+            for field_name, (variants_field_name, _) in (
+                    model.IMAGE_VARIANTS.items()):
+                outdated_pks = [
+                    pk for pk, name, variants
+                    in model.objects.exclude(
+                        **{field_name: ''}).exclude(
+                        **{f'{field_name}__isnull': True}).values_list(
+                        'pk', field_name, variants_field_name).iterator()
+                    if variants.get(SOURCE_KEY) != name]
+                for pk in outdated_pks:
+                    try:
+                        process_image(model, pk, field_name)
+                    except Exception as error:
+                        self.stderr.write(
+                            f'{model.__name__} {pk}: {error}')
+                self.stdout.write(
+                    f'{model._meta.verbose_name_plural}: variants of '
+                    f'{len(outdated_pks)} images are created')
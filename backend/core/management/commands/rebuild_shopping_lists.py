@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ...models import UserShoppingListIngredient
+
+
+class Command(BaseCommand):
+    help = 'Rebuild and verify materialized shopping list totals'
+
+    def handle(self, *args, **options):
+        user_ids = options['users']
+        if not options['check']:
+            with transaction.atomic():
+                rows_count = UserShoppingListIngredient.objects.rebuild(
+                    user_ids)
+            self.stdout.write(f'Rebuilt {rows_count} rows')
+        mismatches = UserShoppingListIngredient.objects.get_mismatches(
+            user_ids)
+        if mismatches:
+            raise CommandError(
+                f'{len(mismatches)} totals are out of date: ' + ', '.join(
+                    f'user {user_id} ingredient {ingredient_id}'
+                    for user_id, ingredient_id in sorted(mismatches)))
+        self.stdout.write(self.style.SUCCESS('Shopping list totals are valid'))
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-u',
+            '--users',
+            action='store',
+            type=int,
+            nargs='+',
+            help='Ids of users which totals are processed (all by default)')
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only verify totals without rebuilding')
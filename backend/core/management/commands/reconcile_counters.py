@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ...models import Recipe, User
+
+
+class Command(BaseCommand):
+    help = 'Reconcile denormalized counters of users and recipes'
+
+    def handle(self, *args, **options):
+        wrong_counters = {}
+        with transaction.atomic():
+            for model in (User, Recipe):
+                wrong_ids = list(model.objects.with_wrong_counters(
+                ).values_list('pk', flat=True))
+                if wrong_ids:
+                    wrong_counters[model._meta.verbose_name_plural] = (
+                        wrong_ids)
+                if wrong_ids and not options['check']:
+                    model.objects.recount_counters(wrong_ids)
+        for verbose_name, wrong_ids in wrong_counters.items():
+            self.stdout.write(
+                f'{verbose_name}: counters of {len(wrong_ids)} '
+                f'records are out of date {wrong_ids}')
+        if options['check'] and wrong_counters:
+            raise CommandError('Counters are out of date')
+        self.stdout.write(self.style.SUCCESS('Counters are valid'))
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only verify counters without fixing')
@@ -0,0 +1,129 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import (override_settings, setup_databases,
+                               teardown_databases)
+
+from ...models import Recipe
+from benchmark.runner import (compare, get_environment, load_results,
+                              run_scenario, save_results)
+from benchmark.scenarios import SCENARIOS, BenchmarkData
+from benchmark.seed import DEFAULT_SCALE, seed
+from benchmark.transports import TRANSPORTS
+
+
+class Command(BaseCommand):
+    help = ('Seed test database to given scale and measure latency and '
+            'queries per request of main API flows through Django test '
+            'client and local WSGI server. Results are saved as JSON and '
+            'can be compared with results of previous run')
+
+    def run(self, options):
+        if Recipe.objects.exists():
+            self.stdout.write('Database is kept, seeding is skipped')
+        else:
+            started = time.perf_counter()
+            seed({key: options[key] for key in DEFAULT_SCALE},
+                 options['seed'])
+            self.stdout.write(
+                f'Seeded in {time.perf_counter() - started:.1f} s')
+        data = BenchmarkData()
+        results = {}
+        # Число запросов к базе берётся из заголовка Server-Timing
+        with override_settings(METRICS_SERVER_TIMING=True):
+            for transport_name in options['transports']:
+                with TRANSPORTS[transport_name]() as transport:
+                    for name in options['scenarios']:
+                        summary = run_scenario(
+                            transport, name, data, options['seed'],
+                            options['requests'], options['warmup'],
+                            options['concurrency'])
+                        results.setdefault(transport_name, {})[name] = (
+                            summary)
+                        self.stdout.write(
+                            f'{transport_name} {name}: '
+                            + ', '.join(f'{key} {value}'
+                                        for key, value in summary.items()))
+        return results
+
+    def handle(self, *args, **options):
+        options['scenarios'] = options['scenarios'] or list(SCENARIOS)
+        options['transports'] = options['transports'] or list(TRANSPORTS)
+        previous = options['compare'] and load_results(options['compare'])
+        environment = get_environment({
+            key: options[key]
+            for key in ('seed', 'requests', 'warmup', 'concurrency',
+                        *DEFAULT_SCALE)})
+        old_config = setup_databases(
+            options['verbosity'], interactive=False,
+            keepdb=options['keepdb'])
+        try:
+            results = self.run(options)
+        finally:
+            teardown_databases(
+                old_config, options['verbosity'], keepdb=options['keepdb'])
+        if not results:
+            raise CommandError('No scenarios were run')
+        output = {'environment': environment, 'results': results}
+        save_results(options['output'], output)
+        self.stdout.write(f'Results are saved to {options["output"]}')
+        if previous:
+            for line in compare(previous, output):
+                self.stdout.write(line)
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-s',
+            '--scenario',
+            dest='scenarios',
+            action='append',
+            choices=tuple(SCENARIOS),
+            help='Scenario to run, can be repeated, all by default')
+        parser.add_argument(
+            '-t',
+            '--transport',
+            dest='transports',
+            action='append',
+            choices=tuple(TRANSPORTS),
+            help='Django test client or local WSGI server, both by default')
+        parser.add_argument(
+            '-n',
+            '--requests',
+            type=int,
+            default=200,
+            help='Number of measured requests of every scenario')
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=20,
+            help='Number of not measured requests sent before them')
+        parser.add_argument(
+            '-c',
+            '--concurrency',
+            type=int,
+            default=1,
+            help='Number of threads sending requests')
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=1,
+            help='Seed of generated data and planned requests')
+        for key, value in DEFAULT_SCALE.items():
+            parser.add_argument(
+                f'--{key}',
+                type=int,
+                default=value,
+                help=(f'Number of {key}' if key in ('users', 'recipes')
+                      else f'Average number of {key} of user'))
+        parser.add_argument(
+            '--keepdb',
+            action='store_true',
+            help='Keep test database and reuse its data in next runs')
+        parser.add_argument(
+            '-o',
+            '--output',
+            default='benchmark.json',
+            help='Path of JSON file with results')
+        parser.add_argument(
+            '--compare',
+            help='Path of JSON file with results of previous run')
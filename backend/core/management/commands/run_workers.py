@@ -0,0 +1,97 @@
+import multiprocessing
+import os
+import signal
+import socket
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from threading import Event
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from ...db_pool import close_pools
+from ...jobs import run_in_thread
+from ...models import Job
+
+
+class Command(BaseCommand):
+    help = ('Run background jobs queued in database with pool of threads '
+            'in one or several processes')
+
+    def stop(self, *args):
+        self.stopping.set()
+
+    def terminate(self, *args):
+        for process in self.processes:
+            process.terminate()
+
+    def work(self, threads, poll_interval, once):
+        """Claim due jobs while there are free threads."""
+        self.stopping = Event()
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        running = set()
+        with ThreadPoolExecutor(
+                threads, thread_name_prefix='jobs') as executor:
+            while not self.stopping.is_set():
+                close_old_connections()
+                running = {future for future in running
+                           if not future.done()}
+                Job.objects.requeue_stale(settings.JOB_TIMEOUT)
+                free_threads = threads - len(running)
+                jobs = (Job.objects.claim(worker, free_threads)
+                        if free_threads else [])
+                for job in jobs:
+                    running.add(executor.submit(run_in_thread, job))
+                if once and not jobs and not running:
+                    break
+                if not jobs:
+                    self.stopping.wait(poll_interval)
+                elif len(running) >= threads:
+                    # Пока все потоки заняты, база не опрашивается
+                    wait(running, poll_interval, FIRST_COMPLETED)
+
+    def handle(self, *args, **options):
+        arguments = (options['threads'], options['poll_interval'],
+                     options['once'])
+        if options['processes'] == 1:
+            self.work(*arguments)
+            return
+        # Соединения, в том числе свободные соединения пула, не должны
+        # переходить в дочерние процессы
+        connections.close_all()
+        close_pools()
+        context = multiprocessing.get_context('fork')
+        self.processes = [
+            context.Process(target=self.work, args=arguments)
+            for _ in range(options['processes'])]
+        for process in self.processes:
+            process.start()
+        signal.signal(signal.SIGTERM, self.terminate)
+        signal.signal(signal.SIGINT, self.terminate)
+        for process in self.processes:
+            process.join()
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-t',
+            '--threads',
+            type=int,
+            default=settings.JOB_WORKER_THREADS,
+            help='Number of jobs run at once by every process')
+        parser.add_argument(
+            '-p',
+            '--processes',
+            type=int,
+            default=1,
+            help='Number of worker processes')
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=settings.JOB_POLL_INTERVAL,
+            help='Seconds between checks of empty queue')
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit when there are no due jobs')
@@ -0,0 +1,40 @@
+from .models import MediaBlob
+from .querysets_n_managers import get_media_fields, get_media_names
+
+
+def remember_media(sender, instance, update_fields=None, **kwargs):
+    """Pre save receiver which keeps files referenced by saved record."""
+    fields = get_media_fields(sender, update_fields)
+    if not fields:
+        instance._old_media_names = None
+    elif instance._state.adding:
+        instance._old_media_names = set()
+    else:
+        instance._old_media_names = get_media_names(
+            sender,
+            sender._default_manager.filter(pk=instance.pk).values(
+                *fields).first() or {})
+
+
+def count_media(sender, instance, update_fields=None, **kwargs):
+    """Post save receiver which moves references to files of record."""
+    old_names = instance.__dict__.pop('_old_media_names', None)
+    if old_names is None:
+        return
+    MediaBlob.objects.change_references(
+        get_media_names(sender, {
+            field: getattr(instance, field)
+            for field in get_media_fields(sender, update_fields)}),
+        old_names)
+
+
+def release_media(sender, instance, **kwargs):
+    """Post delete receiver which uncounts references of record."""
+    fields = get_media_fields(sender)
+    # Без значений полей ссылки исправит collect_media_garbage --recount
+    if fields & instance.get_deferred_fields():
+        return
+    MediaBlob.objects.change_references(
+        set(),
+        get_media_names(sender, {
+            field: getattr(instance, field) for field in fields}))
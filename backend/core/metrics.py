@@ -0,0 +1,259 @@
+import logging
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from threading import Lock
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+
+from .db_pool import POOL_COUNTERS, get_pools_stats
+
+logger = logging.getLogger(__name__)
+
+# Метрики, для которых собираются гистограммы, и их единицы
+HISTOGRAMS = {
+    'queries': ('request_queries', settings.METRICS_QUERY_BUCKETS),
+    'db': ('request_db_seconds', settings.METRICS_DURATION_BUCKETS),
+    'view': ('request_view_seconds', settings.METRICS_DURATION_BUCKETS),
+    'render': ('request_render_seconds', settings.METRICS_DURATION_BUCKETS),
+    'total': ('request_total_seconds', settings.METRICS_DURATION_BUCKETS),
+}
+
+
+class Histogram:
+    """Counts of observed values by upper bounds of buckets."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def get_cumulative_counts(self):
+        total = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            total += count
+            yield bound, total
+
+
+class Registry:
+    """Histograms of requests by endpoint aggregated in this process."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.histograms = {}
+        self.budget_exceeded = {}
+
+    def observe(self, metrics):
+        with self.lock:
+            for metric, value in metrics.get_values().items():
+                key = (metric, metrics.endpoint)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(HISTOGRAMS[metric][1])
+                self.histograms[key].observe(value)
+            if metrics.is_over_budget():
+                self.budget_exceeded[metrics.endpoint] = (
+                    self.budget_exceeded.get(metrics.endpoint, 0) + 1)
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+            self.budget_exceeded.clear()
+
+    def render(self):
+        """Histograms in Prometheus text exposition format."""
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            budget_exceeded = sorted(self.budget_exceeded.items())
+        lines = []
+        described = set()
+        for (metric, endpoint), histogram in histograms:
+            name = f'{settings.METRICS_PREFIX}_{HISTOGRAMS[metric][0]}'
+            if name not in described:
+                described.add(name)
+                lines.append(f'# TYPE {name} histogram')
+            labels = f'endpoint="{endpoint}"'
+            for bound, count in histogram.get_cumulative_counts():
+                lines.append(
+                    f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{name}_sum{{{labels}}} {histogram.sum:g}')
+            lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+        name = f'{settings.METRICS_PREFIX}_query_budget_exceeded_total'
+        lines.append(f'# TYPE {name} counter')
+        for endpoint, count in budget_exceeded:
+            lines.append(f'{name}{{endpoint="{endpoint}"}} {count}')
+        lines.extend(render_pools_stats())
+        return '\n'.join(lines) + '\n'
+
+
+def render_pools_stats():
+    """Counters and current sizes of database connection pools."""
+    pools_stats = get_pools_stats()
+    for stat in (*POOL_COUNTERS, 'size', 'idle', 'in_use', 'max_size'):
+        is_counter = stat in POOL_COUNTERS
+        name = (f'{settings.METRICS_PREFIX}_db_pool_{stat}'
+                + ('_total' if is_counter else ''))
+        yield f'# TYPE {name} {"counter" if is_counter else "gauge"}'
+        for alias, database, stats in pools_stats:
+            yield (f'{name}{{alias="{alias}",database="{database}"}} '
+                   f'{stats[stat]:g}')
+
+
+registry = Registry()
+
+
+class RequestMetrics:
+    """Queries and timings of one request.
+
+    Instance is database execute wrapper, it counts queries and their
+    time for all connections of request thread.
+    """
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.endpoint = None
+        self.budget = None
+        self.queries = []
+        self.db = 0
+        self.view_started = self.view_finished = None
+        self.render = 0
+        self.total = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += perf_counter() - started
+            self.queries.append(sql)
+
+    @property
+    def view(self):
+        if self.view_started is None:
+            return 0
+        return ((self.view_finished or self.started + self.total)
+                - self.view_started)
+
+    def is_over_budget(self):
+        return self.budget is not None and len(self.queries) > self.budget
+
+    def get_values(self):
+        return {'queries': len(self.queries),
+                'db': self.db,
+                'view': self.view,
+                'render': self.render,
+                'total': self.total}
+
+    def get_server_timing(self):
+        return ', '.join((
+            f'db;dur={self.db * 1000:.1f};desc="{len(self.queries)} queries"',
+            f'view;dur={self.view * 1000:.1f}',
+            f'render;dur={self.render * 1000:.1f}',
+            f'total;dur={self.total * 1000:.1f}'))
+
+
+@contextmanager
+def count_queries(metrics):
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(metrics))
+        yield
+
+
+def get_endpoint(request, view_func):
+    """View class and action of DRF views, url name of others."""
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return request.resolver_match.view_name, None
+    method = request.method.lower()
+    action = (getattr(view_func, 'actions', None) or {}).get(method, method)
+    budgets = getattr(view_class, 'query_budgets', {})
+    return f'{view_class.__name__}.{action}', budgets.get(action)
+
+
+class QueryMetricsMiddleware:
+    """Measures queries, database, view, rendering and total time of views.
+
+    Numbers are aggregated per endpoint into histograms shown by
+    api/metrics/ and are sent to client in Server-Timing header. View
+    time includes serializers, rendering is measured separately because
+    DRF renders response after view returns it. Requests which were not
+    resolved to view (404) are not aggregated. Streaming responses are
+    measured until their content is read to the end.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = request.metrics = RequestMetrics()
+        with count_queries(metrics):
+            response = self.get_response(request)
+        response.metrics = metrics
+        if response.streaming:
+            # Запросы потокового ответа выполняются при чтении тела, уже
+            # после отправки заголовков, поэтому Server-Timing не отдаётся
+            if metrics.view_finished is None:
+                metrics.view_finished = perf_counter()
+            response.streaming_content = self.stream(
+                response.streaming_content, metrics)
+            return response
+        self.finish(metrics)
+        if settings.METRICS_SERVER_TIMING:
+            response['Server-Timing'] = metrics.get_server_timing()
+        return response
+
+    def stream(self, content, metrics):
+        try:
+            with count_queries(metrics):
+                yield from content
+        finally:
+            self.finish(metrics)
+
+    def finish(self, metrics):
+        metrics.total = perf_counter() - metrics.started
+        if metrics.endpoint is None:
+            return
+        registry.observe(metrics)
+        if metrics.is_over_budget():
+            logger.warning(
+                '%s made %s queries, budget is %s', metrics.endpoint,
+                len(metrics.queries), metrics.budget)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = request.metrics
+        metrics.endpoint, metrics.budget = get_endpoint(request, view_func)
+        metrics.view_started = perf_counter()
+
+    def process_template_response(self, request, response):
+        metrics = request.metrics
+        metrics.view_finished = perf_counter()
+        response.render()
+        metrics.render = perf_counter() - metrics.view_finished
+        return response
+
+
+def assert_query_budget(response, budget=None):
+    """Fail test when view made more queries than its budget.
+
+    Response is one of test client, budget defaults to query_budgets
+    declared by view class for the action, so N+1 queries added to
+    serializers fail tests which request the endpoint. Content of
+    streaming response is read to count its queries.
+    """
+    metrics = response.metrics
+    if response.streaming and metrics.total is None:
+        b''.join(response.streaming_content)
+    budget = metrics.budget if budget is None else budget
+    if budget is None:
+        raise AssertionError(f'{metrics.endpoint} has no query budget')
+    if len(metrics.queries) > budget:
+        raise AssertionError(
+            f'{metrics.endpoint} made {len(metrics.queries)} queries, '
+            f'budget is {budget}:\n' + '\n'.join(metrics.queries))
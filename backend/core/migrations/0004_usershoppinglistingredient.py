@@ -0,0 +1,52 @@
+# Generated by Django 3.2.4 on 2026-10-18 02:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_list_ingredients(apps, schema_editor):
+    RecipeIngredient = apps.get_model('core', 'RecipeIngredient')
+    UserShoppingListIngredient = apps.get_model(
+        'core', 'UserShoppingListIngredient')
+    UserShoppingListIngredient.objects.bulk_create(
+        (UserShoppingListIngredient(
+            user_id=user_id,
+            ingredient_id=ingredient_id,
+            total_amount=total_amount)
+         for user_id, ingredient_id, total_amount
+         in RecipeIngredient.objects.filter(
+            recipe__shopped_many_table__isnull=False).values_list(
+            'recipe__shopped_many_table__user_id',
+            'ingredient_id').annotate(
+            total_amount=models.Sum('amount')).order_by().iterator()),
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_auto_20240715_1425'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserShoppingListIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.IntegerField(verbose_name='Общее количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_ingredients', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент в списке покупок',
+                'verbose_name_plural': 'Ингредиенты в списках покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='usershoppinglistingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='user_shopping_list_ingredient_unique'),
+        ),
+        migrations.RunPython(
+            fill_shopping_list_ingredients, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.4 on 2026-10-18 02:17
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+def fill_search_vector(apps, schema_editor):
+    Recipe = apps.get_model('core', 'Recipe')
+    Recipe.objects.update(
+        search_vector=django.contrib.postgres.search.SearchVector(
+            'name', weight='A', config=settings.RECIPE_SEARCH_CONFIG)
+        + django.contrib.postgres.search.SearchVector(
+            'text', weight='B', config=settings.RECIPE_SEARCH_CONFIG))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_usershoppinglistingredient'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='recipe_search_vector_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='recipe_name_trigram_gin', opclasses=('gin_trgm_ops',)),
+        ),
+        migrations.RunPython(fill_search_vector, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 3.2.4 on 2026-10-18 02:21
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+COUNTERS = {
+    'User': {
+        'recipes_count': ('Recipe', 'author'),
+        'subscribers_count': ('Subscription', 'subscription'),
+    },
+    'Recipe': {
+        'favorites_count': ('UserRecipeFavorite', 'recipe'),
+        'in_carts_count': ('UserRecipeShoppingList', 'recipe'),
+    },
+}
+
+
+def fill_counters(apps, schema_editor):
+    for model_name, counters in COUNTERS.items():
+        apps.get_model('core', model_name).objects.update(**{
+            counter_name: Coalesce(models.Subquery(
+                apps.get_model('core', counted_model_name).objects.filter(
+                    **{field_name: models.OuterRef('pk')}).order_by().values(
+                    field_name).annotate(
+                    count=models.Count('pk')).values('count')), 0)
+            for counter_name, (counted_model_name, field_name)
+            in counters.items()})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_recipe_author_pub_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество добавлений в избранное'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество добавлений в списки покупок'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество рецептов'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='subscribers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество подписчиков'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
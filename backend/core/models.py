@@ -1,7 +1,10 @@
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser, UnicodeUsernameValidator
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.utils import timezone
 
 from . import querysets_n_managers as q_n_m
 
@@ -47,9 +50,23 @@ class User(AbstractUser):
         through='UserRecipeShoppingList',
         related_name='in_shopping_list_by',
         verbose_name='Рецепты в листе покупок')
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов',
+        default=0,
+        editable=False)
+    subscribers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0,
+        editable=False)
+    avatar_variants = models.JSONField(
+        verbose_name='Обработанные варианты аватара',
+        default=dict,
+        blank=True,
+        editable=False)
 
     objects = q_n_m.AddOptionsUserManager()
 
+    IMAGE_VARIANTS = {'avatar': ('avatar_variants', ('avatar',))}
     REQUIRED_FIELDS = (
         'email',
         'first_name',
@@ -77,6 +94,9 @@ class Subscription(models.Model):
         related_name='subscribers_many_table',
         verbose_name='Пользователь')
 
+    COUNTERS = {'subscription': 'subscribers_count'}
+    USER_FIELD = 'subscriber'
+
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
@@ -230,17 +250,62 @@ class Recipe(models.Model):
                      f'{settings.MIN_COOKING_TIME} минут')
         ),))
     pub_date = models.DateTimeField('Дата публикации', auto_now_add=True)
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Количество добавлений в избранное',
+        default=0,
+        editable=False)
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='Количество добавлений в списки покупок',
+        default=0,
+        editable=False)
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False)
+    image_variants = models.JSONField(
+        verbose_name='Обработанные варианты изображения',
+        default=dict,
+        blank=True,
+        editable=False)
 
     objects = q_n_m.AddOptionsRecipeQuerySet().as_manager()
 
+    COUNTERS = {'author': 'recipes_count'}
+    IMAGE_VARIANTS = {'image': ('image_variants', ('card', 'detail'))}
+
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(
+                name='recipe_pub_date_id_idx',
+                fields=('-pub_date', '-id')
+            ),
+            models.Index(
+                name='recipe_author_pub_date_idx',
+                fields=('author', '-pub_date')
+            ),
+            GinIndex(
+                name='recipe_search_vector_gin',
+                fields=('search_vector',)
+            ),
+            GinIndex(
+                name='recipe_name_trigram_gin',
+                fields=('name',),
+                opclasses=('gin_trgm_ops',)
+            ),
+        )
 
     def __str__(self):
         return f'{self.name} созданный {self.author.username}'
 
+    def save(self, *args, update_fields=None, **kwargs):
+        super().save(*args, update_fields=update_fields, **kwargs)
+        # Сохранение других полей (варианты изображения) вектор не меняет
+        if update_fields is None or set(update_fields) & {'name', 'text'}:
+            Recipe.objects.filter(pk=self.pk).update_search_vector()
+
 
 class UserRecipeFavorite(models.Model):
     """Model for favorite recipe."""
@@ -256,6 +321,9 @@ class UserRecipeFavorite(models.Model):
         related_name='favorites_many_table',
         verbose_name='Пользователь')
 
+    COUNTERS = {'recipe': 'favorites_count'}
+    USER_FIELD = 'user'
+
     class Meta:
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранные'
@@ -284,6 +352,9 @@ class UserRecipeShoppingList(models.Model):
         related_name='shopping_many_table',
         verbose_name='Пользователь')
 
+    COUNTERS = {'recipe': 'in_carts_count'}
+    USER_FIELD = 'user'
+
     class Meta:
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Списки покупок'
@@ -296,3 +367,126 @@ class UserRecipeShoppingList(models.Model):
 
     def __str__(self):
         return f'{self.user} добавил в список покупок {self.recipe}'
+
+
+class UserShoppingListIngredient(models.Model):
+    """Materialized total amount of ingredient in user shopping list."""
+
+    user = models.ForeignKey(
+        'User',
+        on_delete=models.CASCADE,
+        related_name='shopping_list_ingredients',
+        verbose_name='Пользователь')
+    ingredient = models.ForeignKey(
+        'Ingredient',
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Ингредиент')
+    total_amount = models.IntegerField(verbose_name='Общее количество')
+
+    objects = q_n_m.ShoppingListIngredientQuerySet().as_manager()
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списках покупок'
+        constraints = (
+            models.UniqueConstraint(
+                name='user_shopping_list_ingredient_unique',
+                fields=('user', 'ingredient')
+            ),
+        )
+
+    def __str__(self):
+        return (f'{self.user} должен купить {self.ingredient} в '
+                f'количестве {self.total_amount}')
+
+
+class MediaBlob(models.Model):
+    """Stored file with number of records referencing it."""
+
+    name = models.CharField(
+        verbose_name='Имя файла',
+        max_length=255,
+        unique=True)
+    references_count = models.PositiveIntegerField(
+        verbose_name='Количество ссылок',
+        default=0)
+
+    objects = q_n_m.MediaBlobQuerySet().as_manager()
+
+    class Meta:
+        verbose_name = 'Файл'
+        verbose_name_plural = 'Файлы'
+
+    def __str__(self):
+        return f'{self.name} ({self.references_count})'
+
+
+class Job(models.Model):
+    """Background job queued in database and executed by run_workers."""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField(verbose_name='Задача', max_length=128)
+    arguments = models.JSONField(
+        verbose_name='Аргументы',
+        default=dict,
+        blank=True)
+    user = models.ForeignKey(
+        'User',
+        on_delete=models.CASCADE,
+        related_name='jobs',
+        verbose_name='Пользователь',
+        null=True,
+        blank=True)
+    status = models.CharField(
+        verbose_name='Статус',
+        max_length=16,
+        choices=STATUSES,
+        default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(
+        verbose_name='Попыток',
+        default=0)
+    max_attempts = models.PositiveSmallIntegerField(
+        verbose_name='Максимум попыток',
+        default=1)
+    result = models.JSONField(
+        verbose_name='Результат',
+        null=True,
+        blank=True)
+    error = models.TextField(verbose_name='Ошибка', blank=True)
+    worker = models.CharField(
+        verbose_name='Воркер',
+        max_length=128,
+        blank=True)
+    run_after = models.DateTimeField(
+        verbose_name='Выполнить после',
+        default=timezone.now)
+    created = models.DateTimeField('Создана', auto_now_add=True)
+    started = models.DateTimeField('Начата', null=True, blank=True)
+    finished = models.DateTimeField('Завершена', null=True, blank=True)
+
+    objects = q_n_m.JobQuerySet().as_manager()
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        ordering = ('-created',)
+        indexes = (
+            models.Index(
+                name='job_status_run_after_idx',
+                fields=('status', 'run_after')
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.get_status_display()})'
@@ -1,38 +1,359 @@
+from collections import Counter
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
 from django.contrib.auth.models import UserManager
-from django.db import models
-from django.db.models import Exists, OuterRef
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, TrigramSimilarity)
+from django.core.exceptions import EmptyResultSet
+from django.db import connections, models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, RowNumber
+from django.utils import timezone
 
 from . import models as project_models
+from .images import SOURCE_KEY
+
+
+def get_count_subquery(model_name, field_name):
+    return Coalesce(Subquery(
+        getattr(project_models, model_name).objects.filter(
+            **{field_name: OuterRef('pk')}).order_by().values(
+            field_name).annotate(count=Count('pk')).values('count')), 0)
+
+
+class CountersMixin:
+    """Mixin for reconciliation of denormalized counters.
+
+    counters maps counter field name to (model name, field name) of
+    records which are counted.
+    """
 
+    counters = {}
 
-class AddOptionsUserManager(UserManager):
+    def get_actual_counters(self):
+        return {counter_name: get_count_subquery(*counted)
+                for counter_name, counted in self.counters.items()}
+
+    def recount_counters(self, pks=None):
+        records = self.all() if pks is None else self.filter(pk__in=pks)
+        return records.update(**self.get_actual_counters())
+
+    def with_wrong_counters(self):
+        return self.annotate(**{
+            f'actual_{counter_name}': expression
+            for counter_name, expression
+            in self.get_actual_counters().items()}).filter(reduce(
+                or_,
+                (~Q(**{counter_name: F(f'actual_{counter_name}')})
+                 for counter_name in self.counters)))
+
+
+class AddOptionsUserManager(CountersMixin, UserManager):
     """Manager for additional options while making query with User model."""
 
-    def add_is_subscribed_annotate(self, potential_subscriber_id):
-        return self.annotate(
-            is_subscribed=Exists(
-                project_models.Subscription.objects.filter(
-                    subscriber_id=potential_subscriber_id,
-                    subscription_id=OuterRef('pk'))))
+    counters = {
+        'recipes_count': ('Recipe', 'author'),
+        'subscribers_count': ('Subscription', 'subscription'),
+    }
+
 
+def get_recipe_search_vector():
+    return (SearchVector(
+        'name', weight='A', config=settings.RECIPE_SEARCH_CONFIG)
+        + SearchVector(
+            'text', weight='B', config=settings.RECIPE_SEARCH_CONFIG))
 
-class AddOptionsRecipeQuerySet(models.QuerySet):
+
+class AddOptionsRecipeQuerySet(CountersMixin, models.QuerySet):
     """Queryset for additional options while making query with Recipe model."""
 
-    def add_is_favorited_annotate(self, user_id):
-        return self.annotate(
-            is_favorited=Exists(
-                project_models.UserRecipeFavorite.objects.filter(
-                    recipe_id=OuterRef('pk'),
-                    user_id=user_id)))
+    counters = {
+        'favorites_count': ('UserRecipeFavorite', 'recipe'),
+        'in_carts_count': ('UserRecipeShoppingList', 'recipe'),
+    }
+
+    def limit_per_author(self, limit):
+        """Only `limit` newest recipes of every author."""
+        try:
+            ranked_sql, params = self.annotate(row_number=Window(
+                RowNumber(),
+                partition_by=F('author_id'),
+                order_by=F('pub_date').desc())).order_by().values(
+                'pk', 'row_number').query.sql_with_params()
+        except EmptyResultSet:
+            # Например, author__in по пустой странице подписок
+            return self.none()
+        return self.filter(pk__in=RawSQL(
+            f'SELECT "id" FROM ({ranked_sql}) AS "ranked" '
+            'WHERE "row_number" <= %s',
+            (*params, limit)))
 
-    def add_is_in_shopping_cart_annotate(self, user_id):
+    def update_search_vector(self):
+        return self.update(search_vector=get_recipe_search_vector())
+
+    def search(self, text, *alternatives):
+        """Full text and fuzzy name search ordered by relevance.
+
+        Alternatives are Q objects for records which should be found
+        in addition to the matched ones.
+        """
+        query = SearchQuery(
+            text,
+            config=settings.RECIPE_SEARCH_CONFIG,
+            search_type='websearch')
         return self.annotate(
-            is_in_shopping_cart=Exists(
-                project_models.UserRecipeShoppingList.objects.filter(
-                    recipe_id=OuterRef('pk'),
-                    user_id=user_id)))
-
-    def add_all_annotations(self, user_id):
-        return self.add_is_favorited_annotate(
-            user_id).add_is_in_shopping_cart_annotate(user_id)
+            rank=SearchRank(F('search_vector'), query)
+            + TrigramSimilarity('name', text)).filter(reduce(
+                or_,
+                (Q(search_vector=query),
+                 Q(name__trigram_similar=text),
+                 *alternatives))).order_by(
+            '-rank', *self.model._meta.ordering)
+
+
+class ShoppingListIngredientQuerySet(models.QuerySet):
+    """Queryset for maintaining materialized shopping list totals."""
+
+    def shift_amounts(self, user_ids, amounts):
+        """Add amounts ({ingredient_id: amount}) to totals of users.
+
+        Totals are upserted with one INSERT ... ON CONFLICT, so concurrent
+        requests adding the same new ingredient don't conflict, and
+        emptied totals are deleted.
+        """
+        amounts = {ingredient_id: amount
+                   for ingredient_id, amount in amounts.items() if amount}
+        user_ids = sorted(user_ids)
+        if not amounts or not user_ids:
+            return
+        connection = connections[self.db]
+        quote_name = connection.ops.quote_name
+        fields = {field.name: quote_name(field.column)
+                  for field in self.model._meta.concrete_fields}
+        ingredient_ids = sorted(amounts)
+        with transaction.atomic(using=self.db):
+            with connection.cursor() as cursor:
+                # Строки вставляются по порядку ключа, чтобы встречные
+                # изменения одних итогов не блокировали друг друга
+                cursor.execute(
+                    'INSERT INTO {table} AS t ({user}, {ingredient}, {total}) '
+                    'SELECT user_id, ingredient_id, amount '
+                    'FROM UNNEST(%s) AS u(user_id) '
+                    'CROSS JOIN UNNEST(%s, %s) AS a(ingredient_id, amount) '
+                    'ORDER BY user_id, ingredient_id '
+                    'ON CONFLICT ({user}, {ingredient}) DO UPDATE '
+                    'SET {total} = t.{total} + EXCLUDED.{total}'.format(
+                        table=quote_name(self.model._meta.db_table),
+                        user=fields['user'],
+                        ingredient=fields['ingredient'],
+                        total=fields['total_amount']),
+                    (user_ids, ingredient_ids,
+                     [amounts[ingredient_id]
+                      for ingredient_id in ingredient_ids]))
+            self.filter(user_id__in=user_ids, total_amount__lte=0).delete()
+
+    def get_recipes_amounts(self, recipe_ids):
+        """Amounts of ingredients summed over recipes."""
+        return dict(project_models.RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids).values_list('ingredient_id').annotate(
+            amount=Sum('amount')).order_by())
+
+    def add_recipes(self, user_id, recipe_ids):
+        if recipe_ids:
+            self.shift_amounts(
+                (user_id,), self.get_recipes_amounts(recipe_ids))
+
+    def remove_recipes(self, user_id, recipe_ids):
+        if recipe_ids:
+            self.shift_amounts(
+                (user_id,),
+                {ingredient_id: -amount
+                 for ingredient_id, amount
+                 in self.get_recipes_amounts(recipe_ids).items()})
+
+    def add_recipe(self, user_id, recipe_id):
+        self.add_recipes(user_id, (recipe_id,))
+
+    def remove_recipe(self, user_id, recipe_id):
+        self.remove_recipes(user_id, (recipe_id,))
+
+    def change_recipe(self, recipe_id, old_amounts, new_amounts):
+        """Apply recipe ingredients edit to shopping lists containing it."""
+        self.shift_amounts(
+            project_models.UserRecipeShoppingList.objects.filter(
+                recipe_id=recipe_id).values_list('user_id', flat=True),
+            {ingredient_id: (new_amounts.get(ingredient_id, 0)
+                             - old_amounts.get(ingredient_id, 0))
+             for ingredient_id in old_amounts.keys() | new_amounts.keys()})
+
+    def get_actual_totals_rows(self, user_ids=None):
+        """Rows (user_id, ingredient_id, total_amount) of actual totals."""
+        recipe_ingredients = project_models.RecipeIngredient.objects.filter(
+            recipe__shopped_many_table__isnull=False)
+        if user_ids is not None:
+            recipe_ingredients = recipe_ingredients.filter(
+                recipe__shopped_many_table__user_id__in=user_ids)
+        return recipe_ingredients.values_list(
+            'recipe__shopped_many_table__user_id',
+            'ingredient_id').annotate(total_amount=Sum('amount')).order_by()
+
+    def get_actual_totals(self, user_ids=None):
+        """Totals calculated from shopping lists and recipe ingredients."""
+        return {
+            (user_id, ingredient_id): total_amount
+            for user_id, ingredient_id, total_amount
+            in self.get_actual_totals_rows(user_ids)}
+
+    def rebuild(self, user_ids=None):
+        """Recreate totals from scratch with one INSERT ... SELECT."""
+        rows = self.all()
+        if user_ids is not None:
+            rows = rows.filter(user_id__in=user_ids)
+        rows.delete()
+        try:
+            totals_sql, params = self.get_actual_totals_rows(
+                user_ids).query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+        connection = connections[self.db]
+        quote_name = connection.ops.quote_name
+        columns = ', '.join(
+            quote_name(self.model._meta.get_field(name).column)
+            for name in ('user', 'ingredient', 'total_amount'))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {quote_name(self.model._meta.db_table)} '
+                f'({columns}) {totals_sql}', params)
+            return cursor.rowcount
+
+    def get_mismatches(self, user_ids=None):
+        """Pairs (user_id, ingredient_id) which totals are not actual."""
+        rows = self.all()
+        if user_ids is not None:
+            rows = rows.filter(user_id__in=user_ids)
+        stored = {(user_id, ingredient_id): total_amount
+                  for user_id, ingredient_id, total_amount
+                  in rows.values_list(
+                      'user_id', 'ingredient_id', 'total_amount')}
+        actual = self.get_actual_totals(user_ids)
+        return {pair for pair in stored.keys() | actual.keys()
+                if stored.get(pair) != actual.get(pair)}
+
+
+def get_media_fields(model, field_names=None):
+    """Fields with stored files and their variants, all or touching names."""
+    return {name
+            for field_name, (variants_field_name, _)
+            in model.IMAGE_VARIANTS.items()
+            if field_names is None
+            or {field_name, variants_field_name} & set(field_names)
+            for name in (field_name, variants_field_name)}
+
+
+def get_media_names(model, values):
+    """Names of stored files referenced by values of record fields.
+
+    Variants made for other file than the current one are not referenced,
+    they are not shown and will be replaced.
+    """
+    names = set()
+    for field_name, (variants_field_name, _) in (
+            model.IMAGE_VARIANTS.items()):
+        file = values.get(field_name)
+        if not file:
+            continue
+        name = getattr(file, 'name', file)
+        names.add(name)
+        variants = values.get(variants_field_name) or {}
+        if variants.get(SOURCE_KEY) == name:
+            for variant_name, file_names in variants.items():
+                if variant_name != SOURCE_KEY:
+                    names.update(file_names.values())
+    return names
+
+
+class MediaBlobQuerySet(models.QuerySet):
+    """Queryset for reference counts of content addressed files.
+
+    referencing_models are names of models which IMAGE_VARIANTS fields
+    reference files.
+    """
+
+    referencing_models = ('Recipe', 'User')
+
+    def change_references(self, added, removed):
+        """Count references to added names and uncount removed ones."""
+        added, removed = added - removed, removed - added
+        if added:
+            self.bulk_create(
+                (self.model(name=name) for name in added),
+                ignore_conflicts=True)
+            self.filter(name__in=added).update(
+                references_count=F('references_count') + 1)
+        if removed:
+            self.filter(name__in=removed, references_count__gt=0).update(
+                references_count=F('references_count') - 1)
+
+    def get_actual_counts(self):
+        counts = Counter()
+        for model_name in self.referencing_models:
+            model = getattr(project_models, model_name)
+            for values in model._default_manager.values(
+                    *get_media_fields(model)).iterator():
+                counts.update(get_media_names(model, values))
+        return counts
+
+    @transaction.atomic
+    def recount(self):
+        """Recount references of all records, returns number of files."""
+        counts = self.get_actual_counts()
+        self.update(references_count=0)
+        self.bulk_create(
+            (self.model(name=name) for name in counts),
+            batch_size=1000,
+            ignore_conflicts=True)
+        names_by_count = {}
+        for name, count in counts.items():
+            names_by_count.setdefault(count, []).append(name)
+        for count, names in names_by_count.items():
+            self.filter(name__in=names).update(references_count=count)
+        return len(counts)
+
+
+class JobQuerySet(models.QuerySet):
+    """Queryset for taking background jobs by workers."""
+
+    def claim(self, worker, count):
+        """Mark up to count due jobs as running by worker and return them.
+
+        Rows locked by other workers are skipped, so workers don't wait
+        for each other and never take the same job.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            pks = list(self.filter(
+                status=self.model.QUEUED,
+                run_after__lte=now).order_by(
+                'run_after', 'pk').select_for_update(
+                skip_locked=True).values_list('pk', flat=True)[:count])
+            self.filter(pk__in=pks).update(
+                status=self.model.RUNNING,
+                worker=worker,
+                started=now,
+                attempts=F('attempts') + 1)
+        return list(self.filter(pk__in=pks).order_by('run_after', 'pk'))
+
+    def requeue_stale(self, timeout):
+        """Return jobs running longer than timeout (worker died) to queue."""
+        stale = self.filter(
+            status=self.model.RUNNING,
+            started__lt=timezone.now() - timedelta(seconds=timeout))
+        stale.filter(attempts__gte=F('max_attempts')).update(
+            status=self.model.FAILED,
+            error='Timed out',
+            finished=timezone.now())
+        return stale.update(status=self.model.QUEUED)
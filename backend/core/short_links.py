@@ -0,0 +1,50 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+
+from .converters import Base64Converter, decode_id
+
+# Совпадает с путём short-link в backend/urls.py
+SHORT_LINK_PATH = re.compile(
+    f'/s/(?P<code>{Base64Converter.regex})/')
+
+
+def get_recipe_path(pk):
+    return f'/recipes/{pk}'
+
+
+@lru_cache(maxsize=settings.SHORT_LINK_CACHE_SIZE)
+def resolve_short_link(path):
+    """Redirect location for short link path or None."""
+    match = SHORT_LINK_PATH.fullmatch(path)
+    if match is None:
+        return None
+    try:
+        return get_recipe_path(decode_id(match['code']))
+    except ValueError:
+        return None
+
+
+class ShortLinkApplication:
+    """WSGI application which redirects short links before Django.
+
+    Redirect needs neither sessions, authentication nor CSRF checks, so
+    it is answered without request object and middleware, other
+    requests (and invalid codes) are passed to Django application.
+    """
+
+    def __init__(self, application):
+        self.application = application
+
+    def __call__(self, environ, start_response):
+        location = (
+            resolve_short_link(environ.get('PATH_INFO', ''))
+            if environ.get('REQUEST_METHOD') in ('GET', 'HEAD') else None)
+        if location is None:
+            return self.application(environ, start_response)
+        start_response('302 Found', [
+            ('Location', location),
+            ('Content-Length', '0'),
+            ('Content-Type', 'text/html; charset=utf-8')])
+        return (b'',)
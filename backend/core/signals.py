@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Отправляется после массовой загрузки записей модели (bulk_create и COPY
+# не отправляют post_save), чтобы сбросить зависящие от модели кеши
+bulk_loaded = Signal()
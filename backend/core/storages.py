@@ -0,0 +1,49 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """File system storage which names files by SHA-256 of content.
+
+    File is saved to <directory>/<first two hash chars>/<hash><extension>,
+    where directory and extension are taken from proposed name, so equal
+    uploads share one file and existing files are not written again.
+    Files are not deleted by records, collect_media_garbage removes the
+    ones which are not referenced anymore.
+    """
+
+    def get_content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        content_hash = digest.hexdigest()
+        return posixpath.join(
+            posixpath.dirname(name),
+            content_hash[:2],
+            content_hash + posixpath.splitext(name)[1].lower())
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.get_content_name(name, content)
+        if max_length is not None and len(name) > max_length:
+            raise SuspiciousFileOperation(
+                f'Storage name "{name}" is longer than {max_length} '
+                'characters')
+        if self.exists(name):
+            # Свежее время изменения защищает файл от удаления сборщиком
+            os.utime(self.path(name))
+            return name
+        saved_name = self._save(name, content)
+        if saved_name != name:
+            # Тот же файл одновременно записан другим процессом
+            self.delete(saved_name)
+        return name
@@ -0,0 +1,28 @@
+from django.apps import apps
+
+from .images import is_actual, process_image
+from .jobs import enqueue, register
+from .models import User
+
+
+@register('process_image')
+def process_image_job(model, pk, field_name):
+    process_image(apps.get_model(model), pk, field_name)
+
+
+def schedule_processing(sender, instance, update_fields=None, **kwargs):
+    """Post save receiver which queues processing of changed images."""
+    for field_name, (variants_field_name, _) in (
+            sender.IMAGE_VARIANTS.items()):
+        if update_fields is not None and field_name not in update_fields:
+            continue
+        image_file = getattr(instance, field_name)
+        if image_file and not is_actual(
+                getattr(instance, variants_field_name), image_file):
+            # Загрузивший изображение может узнать, готовы ли варианты
+            enqueue('process_image',
+                    user_id=(instance.pk if sender is User
+                             else instance.author_id),
+                    model=sender._meta.label,
+                    pk=instance.pk,
+                    field_name=field_name)
@@ -0,0 +1,336 @@
+import gc
+import random
+import threading
+import time
+import weakref
+
+from django.db import connection, connections, transaction
+from django.db.transaction import TransactionManagementError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from .backends.postgresql.base import DatabaseWrapper
+from .db_pool import ConnectionPool, PoolTimeout
+from .jobs import execute
+from .management.commands._generators import (GENERATED_MODELS, ZipfSampler,
+                                              foreign_keys_dropped)
+from .models import (Ingredient, Job, Recipe, RecipeIngredient, User,
+                     UserShoppingListIngredient)
+
+
+class ExecuteJobTest(TestCase):
+
+    def create_running_job(self, attempts, max_attempts):
+        return Job.objects.create(
+            name='removed_task', status=Job.RUNNING, attempts=attempts,
+            max_attempts=max_attempts)
+
+    def test_unknown_job_is_retried_with_error(self):
+        job = self.create_running_job(1, 3)
+        with self.assertLogs('core.jobs', 'ERROR'):
+            execute(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertIn('Unknown job removed_task', job.error)
+
+    def test_unknown_job_fails_after_last_attempt(self):
+        job = self.create_running_job(3, 3)
+        with self.assertLogs('core.jobs', 'ERROR'):
+            execute(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIsNotNone(job.finished)
+
+
+class GeneratorsTest(SimpleTestCase):
+
+    def test_sample_is_distinct_and_complete(self):
+        sampler = ZipfSampler(list(range(50)), 2.0, random.Random(1))
+        self.assertEqual(sorted(sampler.sample(50)), list(range(50)))
+        self.assertEqual(len(sampler.sample(80)), 50)
+        sample = sampler.sample(20)
+        self.assertEqual(len(set(sample)), 20)
+
+    def test_foreign_keys_are_dropped_only_in_transaction(self):
+        with self.assertRaises(TransactionManagementError):
+            with foreign_keys_dropped(GENERATED_MODELS):
+                pass
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.closed = False
+        self.healthy = True
+
+    def close(self):
+        self.closed = True
+
+
+def check_fake_connection(connection):
+    if not connection.healthy:
+        raise ConnectionError('Connection is broken')
+
+
+def create_pool(max_size=2, timeout=1, max_lifetime=60, check_interval=60):
+    return ConnectionPool(
+        'default', 'test', FakeConnection, check_fake_connection, max_size,
+        timeout, max_lifetime, check_interval)
+
+
+class ConnectionPoolTest(SimpleTestCase):
+
+    def test_connection_is_reused(self):
+        pool = create_pool()
+        connection = pool.acquire()
+        pool.release(connection)
+        self.assertIs(pool.acquire(), connection)
+        self.assertEqual(pool.get_stats()['connects'], 1)
+
+    def test_size_is_bounded_for_threads(self):
+        pool = create_pool(max_size=3, timeout=5)
+        lock = threading.Lock()
+        in_use = set()
+        max_in_use = 0
+
+        def work():
+            nonlocal max_in_use
+            for _ in range(20):
+                connection = pool.acquire()
+                with lock:
+                    self.assertNotIn(connection, in_use)
+                    in_use.add(connection)
+                    max_in_use = max(max_in_use, len(in_use))
+                time.sleep(0.001)
+                with lock:
+                    in_use.remove(connection)
+                pool.release(connection)
+
+        threads = [threading.Thread(target=work) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = pool.get_stats()
+        self.assertEqual(max_in_use, 3)
+        self.assertEqual(stats['connects'], 3)
+        self.assertEqual(stats['checkouts'], 200)
+        self.assertGreater(stats['waits'], 0)
+        self.assertEqual(stats['timeouts'], 0)
+        self.assertEqual((stats['size'], stats['in_use']), (3, 0))
+
+    def test_timeout_is_raised_and_counted(self):
+        pool = create_pool(max_size=1, timeout=0.05)
+        pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        stats = pool.get_stats()
+        self.assertEqual((stats['waits'], stats['timeouts']), (1, 1))
+        self.assertGreaterEqual(stats['wait_seconds'], 0.05)
+
+    def test_waiting_thread_gets_released_connection(self):
+        pool = create_pool(max_size=1)
+        connection = pool.acquire()
+        acquired = []
+        thread = threading.Thread(
+            target=lambda: acquired.append(pool.acquire()))
+        thread.start()
+        time.sleep(0.05)
+        pool.release(connection)
+        thread.join()
+        self.assertEqual(acquired, [connection])
+        self.assertEqual(pool.get_stats()['waits'], 1)
+
+    def test_connection_failed_check_is_replaced(self):
+        pool = create_pool(max_size=1, check_interval=0)
+        connection = pool.acquire()
+        pool.release(connection)
+        connection.healthy = False
+        replacement = pool.acquire()
+        self.assertIsNot(replacement, connection)
+        self.assertTrue(connection.closed)
+        stats = pool.get_stats()
+        self.assertEqual((stats['failed_checks'], stats['closes']), (1, 1))
+        self.assertEqual(stats['size'], 1)
+
+    def test_expired_connection_is_replaced(self):
+        pool = create_pool(max_lifetime=0.05)
+        connection = pool.acquire()
+        pool.release(connection)
+        time.sleep(0.06)
+        self.assertIsNot(pool.acquire(), connection)
+        self.assertTrue(connection.closed)
+        expired = pool.acquire()
+        time.sleep(0.06)
+        pool.release(expired)
+        self.assertTrue(expired.closed)
+        self.assertEqual(pool.get_stats()['idle'], 0)
+
+    def test_not_reusable_connection_is_closed(self):
+        pool = create_pool()
+        connection = pool.acquire()
+        pool.release(connection, reusable=False)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.get_stats()['size'], 0)
+
+    def test_connections_of_parent_are_not_used_after_fork(self):
+        pool = create_pool()
+        idle = pool.acquire()
+        checked_out = pool.acquire()
+        pool.release(idle)
+        pool.pid = -1
+        connection = pool.acquire()
+        self.assertNotIn(connection, (idle, checked_out))
+        pool.release(checked_out)
+        self.assertFalse(idle.closed or checked_out.closed)
+        self.assertEqual(pool.get_stats()['size'], 1)
+        # Удалённое сборщиком соединение psycopg2 закрывает сокет,
+        # общий с родителем, поэтому пул хранит ссылки на них
+        parent_connections = weakref.WeakSet((idle, checked_out))
+        del idle, checked_out
+        gc.collect()
+        self.assertEqual(len(parent_connections), 2)
+
+    def test_closed_pool_closes_released_connections(self):
+        pool = create_pool()
+        idle = pool.acquire()
+        checked_out = pool.acquire()
+        pool.release(idle)
+        pool.close()
+        self.assertTrue(idle.closed)
+        pool.release(checked_out)
+        self.assertTrue(checked_out.closed)
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+
+
+class PooledDatabaseWrapperTest(TestCase):
+    """Connections returned to pool by separate wrapper of test database.
+
+    Wrapper shares pool with connection of test case, which holds its own
+    connection in transaction of the test.
+    """
+
+    def setUp(self):
+        self.wrapper = DatabaseWrapper({**connection.settings_dict})
+
+    def tearDown(self):
+        self.wrapper.close()
+
+    def test_unfinished_transaction_is_rolled_back(self):
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('BEGIN')
+            cursor.execute('CREATE TEMPORARY TABLE pool_test (id int)')
+        raw_connection = self.wrapper.connection
+        self.wrapper.close()
+        with self.wrapper.cursor() as cursor:
+            cursor.execute(
+                "SELECT count(*) FROM pg_class WHERE relname = 'pool_test'")
+            self.assertEqual(cursor.fetchone(), (0,))
+        self.assertIs(self.wrapper.connection, raw_connection)
+
+    def test_broken_connection_is_not_reused(self):
+        self.wrapper.ensure_connection()
+        raw_connection = self.wrapper.connection
+        raw_connection.close()
+        self.wrapper.close()
+        self.wrapper.ensure_connection()
+        self.assertIsNot(self.wrapper.connection, raw_connection)
+
+
+class ShoppingListTotalsTest(TransactionTestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='buyer', email='buyer@example.org', password='password')
+        author = User.objects.create_user(
+            username='author', email='author@example.org',
+            password='password')
+        salt, egg, milk = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('соль', 'яйцо', 'молоко'))
+        self.recipes = []
+        for name, ingredients in (('omelette', ((egg, 3), (milk, 100))),
+                                  ('boiled', ((egg, 2), (salt, 5)))):
+            recipe = Recipe.objects.create(
+                author=author, name=name, text=name, cooking_time=10,
+                image=f'recipes/images/{name}.png')
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=amount)
+                for ingredient, amount in ingredients)
+            self.recipes.append(recipe.id)
+
+    def get_totals(self):
+        return dict(UserShoppingListIngredient.objects.filter(
+            user=self.user).values_list('ingredient__name', 'total_amount'))
+
+    def test_totals_are_added_and_removed(self):
+        totals = UserShoppingListIngredient.objects
+        totals.add_recipes(self.user.id, self.recipes)
+        self.assertEqual(self.get_totals(),
+                         {'яйцо': 5, 'молоко': 100, 'соль': 5})
+        totals.remove_recipe(self.user.id, self.recipes[0])
+        self.assertEqual(self.get_totals(), {'яйцо': 2, 'соль': 5})
+        totals.remove_recipe(self.user.id, self.recipes[1])
+        self.assertEqual(self.get_totals(), {})
+
+    def test_concurrent_additions_of_new_ingredient(self):
+        added = threading.Event()
+        errors = []
+
+        def add_recipe(recipe_id, wait):
+            try:
+                with transaction.atomic():
+                    UserShoppingListIngredient.objects.add_recipe(
+                        self.user.id, recipe_id)
+                    added.set()
+                    # Первая транзакция держит вставленные итоги, пока
+                    # вторая пытается вставить ту же пару
+                    if wait:
+                        time.sleep(0.2)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        first = threading.Thread(
+            target=add_recipe, args=(self.recipes[0], True))
+        first.start()
+        added.wait(5)
+        second = threading.Thread(
+            target=add_recipe, args=(self.recipes[1], False))
+        second.start()
+        first.join()
+        second.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.get_totals(),
+                         {'яйцо': 5, 'молоко': 100, 'соль': 5})
+
+
+class RecipeSearchVectorTest(TestCase):
+
+    def setUp(self):
+        author = User.objects.create_user(
+            username='author', email='author@example.org',
+            password='password')
+        self.recipe = Recipe.objects.create(
+            author=author, name='Омлет', text='Взбить яйца', cooking_time=10,
+            image='recipes/images/omelette.png')
+
+    def save(self, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            self.recipe.save(**kwargs)
+        return any('search_vector' in query['sql']
+                   for query in queries.captured_queries)
+
+    def test_vector_is_updated_with_name_and_text(self):
+        self.recipe.name = 'Блины'
+        self.assertTrue(self.save(update_fields=('name',)))
+        self.assertTrue(self.save())
+        self.assertTrue(Recipe.objects.search('блины').filter(
+            pk=self.recipe.pk).exists())
+
+    def test_vector_is_not_updated_with_other_fields(self):
+        self.recipe.image_variants = {}
+        self.assertFalse(self.save(update_fields=('image_variants',)))
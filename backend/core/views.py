@@ -1,6 +1,12 @@
 from django.shortcuts import redirect
 
+from .short_links import get_recipe_path
+
 
 def redirect_short_link(request, pk):
-    """Simple redirect to main url recipe from short link."""
-    return redirect(request.build_absolute_uri(f'/recipes/{pk}'))
+    """Simple redirect to main url recipe from short link.
+
+    Served by ShortLinkApplication before Django in WSGI, the view is
+    used when application is not wrapped (e.g. by test client).
+    """
+    return redirect(get_recipe_path(pk))